@@ -51,6 +51,28 @@ class CoralMCCog(commands.Cog):
         self._rate_limit[interaction.user.id] = now
         return True
 
+    async def _lookup(self, kind: str, cache: Dict[str, Tuple[float, Any]], uname: str, fetch) -> Tuple[Optional[Any], bool]:
+        """Restituisce (valore, da_cache); i miss contemporanei sullo stesso username condividono
+        richiesta, parsing e scrittura in cache tramite il single-flight del client."""
+        key = self.client.normalize_username(uname)
+        cached = cache.get(key)
+        if cached and time.time() - cached[0] < self.cache_ttl:
+            return cached[1], True
+
+        async def fetch_and_cache():
+            value = await fetch(key)
+            if value:
+                cache[key] = (time.time(), value)
+            return value
+
+        return await self.client.single_flight((kind, key), fetch_and_cache), False
+
+    async def _get_stats(self, uname: str) -> Tuple[Optional[PlayerStats], bool]:
+        return await self._lookup('stats', self.cache_stats, uname, self.client.get_player_stats)
+
+    async def _get_info(self, uname: str) -> Tuple[Optional[PlayerInfo], bool]:
+        return await self._lookup('info', self.cache_info, uname, self.client.get_player_info)
+
     def _build_stats_embed(self, username: str, stats: PlayerStats, source: str) -> discord.Embed:
         bed = stats.bedwars
         # Calcoli utili
@@ -115,19 +137,11 @@ class CoralMCCog(commands.Cog):
             return
         uname = username.strip()
         try:
-            now = time.time()
-            cached = self.cache_stats.get(uname.lower())
-            stats: Optional[PlayerStats] = None
-            if cached and now - cached[0] < self.cache_ttl:
-                stats = cached[1]
-            else:
-                stats = await self.client.get_player_stats(uname)
-                if stats:
-                    self.cache_stats[uname.lower()] = (now, stats)
+            stats, from_cache = await self._get_stats(uname)
             if not stats:
                 await interaction.followup.send('❌ Giocatore non trovato o errore API.', ephemeral=not public)
                 return
-            source = 'CACHE' if cached and now - cached[0] < self.cache_ttl else 'LIVE'
+            source = 'CACHE' if from_cache else 'LIVE'
             embed = self._build_stats_embed(uname, stats, source)
             await interaction.followup.send(embed=embed, ephemeral=not public)
         except Exception as e:
@@ -146,15 +160,7 @@ class CoralMCCog(commands.Cog):
             return
         uname = username.strip()
         try:
-            now = time.time()
-            cached = self.cache_info.get(uname.lower())
-            info: Optional[PlayerInfo] = None
-            if cached and now - cached[0] < self.cache_ttl:
-                info = cached[1]
-            else:
-                info = await self.client.get_player_info(uname)
-                if info:
-                    self.cache_info[uname.lower()] = (now, info)
+            info, from_cache = await self._get_info(uname)
             if not info:
                 await interaction.followup.send('❌ Giocatore non trovato o errore API.', ephemeral=not public)
                 return
@@ -191,7 +197,7 @@ class CoralMCCog(commands.Cog):
             embed.description = f"**Stato:** {stato}\n**Rank:** {emoji} `{rank_bw}`\n**Raw:** `{raw_bw}`"
             avatar_url = f"https://mc-heads.net/avatar/{info.username}/128"
             embed.set_thumbnail(url=avatar_url)
-            source = 'CACHE' if cached and now - cached[0] < self.cache_ttl else 'LIVE'
+            source = 'CACHE' if from_cache else 'LIVE'
             embed.set_footer(text=f'Fonte: {source} • TTL {self.cache_ttl}s')
             await interaction.followup.send(embed=embed, ephemeral=not public)
         except Exception as e:
@@ -213,7 +219,7 @@ class CoralMCCog(commands.Cog):
         if not interaction.user.guild_permissions.manage_guild:
             await interaction.response.send_message('❌ Permessi insufficienti.', ephemeral=True)
             return
-        uname = username.lower()
+        uname = self.client.normalize_username(username)
         removed = False
         if uname in self.cache_info:
             del self.cache_info[uname]
@@ -255,25 +261,8 @@ class CoralMCCog(commands.Cog):
             return
         uname = username.strip()
         try:
-            now = time.time()
-            # Info cache
-            cached_info = self.cache_info.get(uname.lower())
-            info: Optional[PlayerInfo] = None
-            if cached_info and now - cached_info[0] < self.cache_ttl:
-                info = cached_info[1]
-            else:
-                info = await self.client.get_player_info(uname)
-                if info:
-                    self.cache_info[uname.lower()] = (now, info)
-            # Stats cache
-            cached_stats = self.cache_stats.get(uname.lower())
-            stats: Optional[PlayerStats] = None
-            if cached_stats and now - cached_stats[0] < self.cache_ttl:
-                stats = cached_stats[1]
-            else:
-                stats = await self.client.get_player_stats(uname)
-                if stats:
-                    self.cache_stats[uname.lower()] = (now, stats)
+            # info e stats in parallelo (cache + single-flight)
+            (info, _), (stats, _) = await asyncio.gather(self._get_info(uname), self._get_stats(uname))
             if not info and not stats:
                 await interaction.followup.send('❌ Giocatore non trovato o errore API.', ephemeral=not public)
                 return
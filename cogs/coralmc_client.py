@@ -1,7 +1,8 @@
 import aiohttp
 import re
 import asyncio
-from typing import Optional, Dict, Any, List
+import functools
+from typing import Optional, Dict, Any, List, Awaitable, Callable, Hashable
 
 class PlayerInfo:
     def __init__(self, username: str, is_banned: bool, ranks: Dict[str, Any]):
@@ -75,26 +76,50 @@ class CoralMCClient:
 
     def __init__(self):
         self.session: Optional[aiohttp.ClientSession] = None
-        self._lock = asyncio.Lock()
         self.timeout = aiohttp.ClientTimeout(total=8)
+        # chiave -> operazione in corso, condivisa da chi chiede la stessa cosa nello stesso momento
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
 
     @staticmethod
     def is_username_valid(username: str) -> bool:
         return 3 <= len(username) <= 16 and bool(re.match(r"^[a-zA-Z0-9_]+$", username))
 
+    @staticmethod
+    def normalize_username(username: str) -> str:
+        # gli username Minecraft non distinguono maiuscole: "Foo" e "foo" sono la stessa richiesta
+        return username.strip().lower()
+
+    async def single_flight(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """Single-flight: le chiamate contemporanee con la stessa chiave eseguono `factory()` una volta sola.
+
+        Richiesta, parsing ed eventuale scrittura in cache vanno messi tutti
+        dentro `factory`, cosi' avvengono una sola volta per chiave. Il
+        risultato e' condiviso tra i chiamanti e non va modificato.
+        """
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(factory())
+            self._inflight[key] = future
+            future.add_done_callback(functools.partial(self._forget_inflight, key))
+        # shield: se un chiamante viene annullato l'operazione continua per gli altri
+        return await asyncio.shield(future)
+
+    def _forget_inflight(self, key: Hashable, future: asyncio.Future):
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+
     async def _get_json(self, endpoint: str) -> Dict[str, Any]:
-        async with self._lock:
-            if self.session is None:
-                self.session = aiohttp.ClientSession(timeout=self.timeout)
-            try:
-                async with self.session.get(endpoint) as response:
-                    if response.status != 200:
-                        return {"error": f"status_{response.status}"}
-                    return await response.json()
-            except asyncio.TimeoutError:
-                return {"error": "timeout"}
-            except aiohttp.ClientError as e:
-                return {"error": f"client_{e.__class__.__name__}"}
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(timeout=self.timeout)
+        try:
+            async with self.session.get(endpoint) as response:
+                if response.status != 200:
+                    return {"error": f"status_{response.status}"}
+                return await response.json()
+        except asyncio.TimeoutError:
+            return {"error": "timeout"}
+        except aiohttp.ClientError as e:
+            return {"error": f"client_{e.__class__.__name__}"}
 
     async def get_bedwars_winstreak_top(self, limit: int = 100) -> Optional[List[Dict[str, Any]]]:
         data = await self._get_json(f"https://api.coralmc.it/api/leaderboard/bedwars/winstreak?limit={limit}")
@@ -122,9 +147,7 @@ class CoralMCClient:
     async def get_player_stats(self, username: str) -> Optional[PlayerStats]:
         if not self.is_username_valid(username):
             return None
-        if self.session is None:
-            self.session = aiohttp.ClientSession()
-        json_data = await self._get_json(f"{self.BASE_URL}{username}")
+        json_data = await self._get_json(f"{self.BASE_URL}{self.normalize_username(username)}")
         if json_data.get("error") is not None:
             return None
         return PlayerStats.from_json(json_data)
@@ -132,9 +155,7 @@ class CoralMCClient:
     async def get_player_info(self, username: str) -> Optional[PlayerInfo]:
         if not self.is_username_valid(username):
             return None
-        if self.session is None:
-            self.session = aiohttp.ClientSession()
-        json_data = await self._get_json(f"{self.BASE_URL}{username}/infos")
+        json_data = await self._get_json(f"{self.BASE_URL}{self.normalize_username(username)}/infos")
         return PlayerInfo.from_json(json_data)
 
     async def close(self) -> None:
@@ -0,0 +1,94 @@
+import aiohttp
+import asyncio
+import logging
+import random
+from typing import Optional, Dict, Any, List, Tuple
+
+logger = logging.getLogger("tts")
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+STREAM_OUTPUT_FORMAT = "mp3_44100_128"
+STREAM_CHUNK_SIZE = 4096
+
+
+class ElevenLabsError(Exception):
+    pass
+
+
+class ElevenLabsClient:
+    """Client asincrono per le API ElevenLabs.
+
+    Una sola `aiohttp.ClientSession` (connessioni riusate, limite per host),
+    timeout espliciti e retry con backoff esponenziale + jitter sugli errori
+    di rete e sulle risposte 429/5xx.
+    """
+    BASE_URL: str = "https://api.elevenlabs.io/v1"
+
+    def __init__(self, api_key: Optional[str], retries: int = 3, max_connections: int = 8):
+        self.api_key = api_key
+        self.retries = retries
+        self.max_connections = max_connections
+        self.session: Optional[aiohttp.ClientSession] = None
+        self.timeout = aiohttp.ClientTimeout(total=60, connect=5, sock_read=20)
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit_per_host=self.max_connections, ttl_dns_cache=300)
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=self.timeout,
+                headers={"xi-api-key": self.api_key or ""}
+            )
+        return self.session
+
+    async def _request(self, method: str, path: str, **kwargs) -> aiohttp.ClientResponse:
+        """Esegue la richiesta con retry; il chiamante deve rilasciare la risposta."""
+        session = self._get_session()
+        delay = 0.5
+        for attempt in range(self.retries + 1):
+            try:
+                response = await session.request(method, f"{self.BASE_URL}{path}", **kwargs)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if attempt >= self.retries:
+                    raise ElevenLabsError(f"{e.__class__.__name__}: {e}") from e
+            else:
+                if response.status < 400:
+                    return response
+                body = (await response.text())[:200]
+                response.release()
+                if response.status not in RETRY_STATUSES or attempt >= self.retries:
+                    raise ElevenLabsError(f"status_{response.status}: {body}")
+                retry_after = response.headers.get("Retry-After")
+                if retry_after and retry_after.isdigit():
+                    delay = max(delay, float(retry_after))
+            await asyncio.sleep(delay + random.uniform(0, delay / 2))
+            delay *= 2
+        raise ElevenLabsError("retry esauriti")
+
+    async def get_voices(self, etag: Optional[str] = None) -> Tuple[Optional[List[Dict[str, Any]]], Optional[str]]:
+        """Restituisce (voci, etag); voci e' None se il catalogo non e' cambiato (304)."""
+        headers = {"If-None-Match": etag} if etag else None
+        response = await self._request("GET", "/voices", headers=headers)
+        try:
+            if response.status == 304:
+                return None, etag
+            data = await response.json()
+            return data.get("voices", []), response.headers.get("ETag")
+        finally:
+            response.release()
+
+    async def open_stream(self, text: str, voice_id: str, model_id: str, voice_settings: Dict[str, Any]) -> aiohttp.ClientResponse:
+        """Avvia la sintesi in streaming (MP3); i retry valgono solo fino all'arrivo degli header.
+
+        Il chiamante legge `response.content` a chunk e poi chiama `release()`.
+        """
+        return await self._request(
+            "POST", f"/text-to-speech/{voice_id}/stream",
+            params={"output_format": STREAM_OUTPUT_FORMAT},
+            json={"model_id": model_id, "text": text, "voice_settings": voice_settings}
+        )
+
+    async def close(self) -> None:
+        if self.session:
+            await self.session.close()
+            self.session = None
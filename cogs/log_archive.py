@@ -0,0 +1,195 @@
+import gzip
+import json
+import os
+import shutil
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Optional, Dict, Any, List, Set
+
+BASE_DIR = os.path.dirname(__file__)
+ARCHIVE_DIR = os.path.join(os.path.dirname(BASE_DIR), 'log_archive')
+INDEX_FILE = 'index.json'
+INDEX_KINDS = ('guild', 'user', 'event')
+
+
+class LogArchive:
+    """Archivio locale append-only degli eventi di log (segmenti JSONL + indice).
+
+    `record` e' economico e puo' essere chiamato dal loop; `flush` e `search`
+    fanno I/O su disco e vanno eseguiti in un thread (asyncio.to_thread).
+    """
+
+    def __init__(self, directory: str = ARCHIVE_DIR, max_bytes: int = 5 * 1024 * 1024, max_age: int = 24 * 3600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._pending: List[Dict[str, Any]] = []
+        self._pending_lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._segment: Optional[str] = None
+        self._segment_opened = 0.0
+        self._index: Dict[str, Dict[str, Set[str]]] = {k: {} for k in INDEX_KINDS}
+        self._index_dirty = False
+        os.makedirs(self.directory, exist_ok=True)
+        self._load_index()
+        self._resume_segments()
+
+    # ------------------------------
+    # Scrittura
+    # ------------------------------
+    def record(self, event: str, guild_id=None, user_id=None, **fields):
+        entry = {
+            'ts': datetime.now(timezone.utc).isoformat(),
+            'event': event,
+            'guild_id': str(guild_id) if guild_id else None,
+            'user_id': str(user_id) if user_id else None,
+        }
+        for k, v in fields.items():
+            if v is not None:
+                entry[k] = v if isinstance(v, (int, float, bool)) else str(v)
+        with self._pending_lock:
+            self._pending.append(entry)
+
+    def flush(self) -> int:
+        with self._pending_lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return 0
+        with self._io_lock:
+            if self._segment is None or self._should_rotate():
+                self._rotate()
+            path = os.path.join(self.directory, self._segment)
+            with open(path, 'a', encoding='utf-8') as f:
+                for entry in batch:
+                    f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                    self._index_entry(entry, self._segment)
+            if self._index_dirty:
+                self._save_index()
+        return len(batch)
+
+    def _should_rotate(self) -> bool:
+        if time.time() - self._segment_opened >= self.max_age:
+            return True
+        try:
+            return os.path.getsize(os.path.join(self.directory, self._segment)) >= self.max_bytes
+        except OSError:
+            return False
+
+    def _rotate(self):
+        if self._segment is not None:
+            self._compress(self._segment)
+        self._segment = datetime.now(timezone.utc).strftime('%Y%m%d_%H%M%S_%f') + '.jsonl'
+        self._segment_opened = time.time()
+
+    def _compress(self, segment: str):
+        src = os.path.join(self.directory, segment)
+        if not os.path.exists(src):
+            return
+        dst = src + '.gz'
+        with open(src, 'rb') as fin, gzip.open(dst, 'wb') as fout:
+            shutil.copyfileobj(fin, fout)
+        os.remove(src)
+        for kind in INDEX_KINDS:
+            for segments in self._index[kind].values():
+                if segment in segments:
+                    segments.discard(segment)
+                    segments.add(segment + '.gz')
+        self._index_dirty = True
+
+    def _resume_segments(self):
+        # Riprende l'ultimo segmento aperto e comprime quelli rimasti in chiaro
+        open_segments = sorted(f for f in os.listdir(self.directory) if f.endswith('.jsonl'))
+        for segment in open_segments[:-1]:
+            try:
+                self._compress(segment)
+            except Exception:
+                pass
+        if open_segments:
+            self._segment = open_segments[-1]
+            try:
+                self._segment_opened = os.path.getctime(os.path.join(self.directory, self._segment))
+            except OSError:
+                self._segment_opened = time.time()
+        if self._index_dirty:
+            self._save_index()
+
+    # ------------------------------
+    # Indice
+    # ------------------------------
+    def _index_entry(self, entry: Dict[str, Any], segment: str):
+        for kind, key in (('guild', entry.get('guild_id')), ('user', entry.get('user_id')), ('event', entry.get('event'))):
+            if not key:
+                continue
+            segments = self._index[kind].setdefault(key, set())
+            if segment not in segments:
+                segments.add(segment)
+                self._index_dirty = True
+
+    def _load_index(self):
+        try:
+            with open(os.path.join(self.directory, INDEX_FILE), 'r', encoding='utf-8') as f:
+                raw = json.load(f)
+            for kind in INDEX_KINDS:
+                self._index[kind] = {k: set(v) for k, v in raw.get(kind, {}).items()}
+        except Exception:
+            self._index = {k: {} for k in INDEX_KINDS}
+
+    def _save_index(self):
+        path = os.path.join(self.directory, INDEX_FILE)
+        tmp = path + '.tmp'
+        data = {kind: {k: sorted(v) for k, v in self._index[kind].items()} for kind in INDEX_KINDS}
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, path)
+        self._index_dirty = False
+
+    # ------------------------------
+    # Ricerca
+    # ------------------------------
+    def search(self, guild_id=None, user_id=None, event: Optional[str] = None, text: Optional[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
+        filters = {'guild': str(guild_id) if guild_id else None, 'user': str(user_id) if user_id else None, 'event': event}
+        with self._io_lock:
+            candidates: Optional[Set[str]] = None
+            for kind, key in filters.items():
+                if not key:
+                    continue
+                segments = set(self._index[kind].get(key, ()))
+                candidates = segments if candidates is None else candidates & segments
+            if candidates is None:
+                candidates = {f for f in os.listdir(self.directory) if f.endswith('.jsonl') or f.endswith('.jsonl.gz')}
+            ordered = sorted(candidates, reverse=True)
+        needle = text.lower() if text else None
+        results: List[Dict[str, Any]] = []
+        for segment in ordered:
+            matches = []
+            for entry in self._read_segment(segment):
+                if filters['guild'] and entry.get('guild_id') != filters['guild']:
+                    continue
+                if filters['user'] and entry.get('user_id') != filters['user']:
+                    continue
+                if event and entry.get('event') != event:
+                    continue
+                if needle and needle not in json.dumps(entry, ensure_ascii=False).lower():
+                    continue
+                matches.append(entry)
+            results.extend(reversed(matches))
+            if len(results) >= limit:
+                break
+        return results[:limit]
+
+    def _read_segment(self, segment: str):
+        path = os.path.join(self.directory, segment)
+        opener = gzip.open if segment.endswith('.gz') else open
+        try:
+            with opener(path, 'rt', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+        except OSError:
+            return
@@ -0,0 +1,99 @@
+import time
+from typing import Optional, Dict, Any, List, Tuple, Iterable
+
+RULE_SEND = 'send'
+RULE_DROP = 'drop'
+RULE_SUMMARY = 'summary'
+
+
+def _id_set(values) -> frozenset:
+    out = set()
+    for v in values or ():
+        try:
+            out.add(int(v))
+        except (TypeError, ValueError):
+            continue
+    return frozenset(out)
+
+
+class CompiledRule:
+    """Regola di filtro per un singolo tipo di evento, con ID gia' convertiti."""
+    __slots__ = ('ignore_channels', 'ignore_roles', 'ignore_users', 'max_per_user', 'window', 'summary_only')
+
+    def __init__(self, cfg: Dict[str, Any]):
+        self.ignore_channels = _id_set(cfg.get('ignore_channels'))
+        self.ignore_roles = _id_set(cfg.get('ignore_roles'))
+        self.ignore_users = _id_set(cfg.get('ignore_users'))
+        self.max_per_user = int(cfg.get('max_per_user') or 0)
+        self.window = max(5, int(cfg.get('window_seconds') or 60))
+        self.summary_only = cfg.get('mode') == 'summary'
+
+
+class LogRuleEngine:
+    """Valuta le regole `event_rules` di logs.json prima di costruire gli embed.
+
+    Esempio di configurazione:
+        "event_rules": {
+            "vc_move": {"ignore_channels": [123], "mode": "summary", "window_seconds": 60},
+            "message_edit": {"ignore_roles": [456], "max_per_user": 5, "window_seconds": 60}
+        }
+    Gli eventi oltre il limite per utente e quelli in modalita' "summary"
+    vengono contati e riassunti in un unico messaggio per finestra.
+    """
+
+    def __init__(self):
+        self._rules: Dict[str, CompiledRule] = {}
+        self._counters: Dict[Tuple[str, int], List[float]] = {}
+        self._summaries: Dict[Tuple[str, int], Dict[str, Any]] = {}
+
+    def load(self, rules_cfg: Optional[Dict[str, Any]]):
+        compiled = {}
+        for event, cfg in (rules_cfg or {}).items():
+            if isinstance(cfg, dict):
+                compiled[event] = CompiledRule(cfg)
+        self._rules = compiled
+
+    def check(self, event: str, user_id: Optional[int] = None, channel_ids: Iterable[int] = (), role_ids: Iterable[int] = (), log_channel_id: Optional[int] = None, label: Optional[str] = None) -> str:
+        rule = self._rules.get(event)
+        if rule is None:
+            return RULE_SEND
+        if user_id is not None and user_id in rule.ignore_users:
+            return RULE_DROP
+        if rule.ignore_channels and any(c in rule.ignore_channels for c in channel_ids):
+            return RULE_DROP
+        if rule.ignore_roles and any(r in rule.ignore_roles for r in role_ids):
+            return RULE_DROP
+        now = time.monotonic()
+        if not rule.summary_only:
+            if not rule.max_per_user or user_id is None:
+                return RULE_SEND
+            counter = self._counters.get((event, user_id))
+            if counter is None or now - counter[0] >= rule.window:
+                self._counters[(event, user_id)] = [now, 1]
+                return RULE_SEND
+            counter[1] += 1
+            if counter[1] <= rule.max_per_user:
+                return RULE_SEND
+        if log_channel_id is None:
+            return RULE_DROP
+        summary = self._summaries.get((event, log_channel_id))
+        if summary is None:
+            summary = self._summaries[(event, log_channel_id)] = {'start': now, 'window': rule.window, 'count': 0, 'users': {}}
+        summary['count'] += 1
+        if label:
+            summary['users'][label] = summary['users'].get(label, 0) + 1
+        return RULE_SUMMARY
+
+    def due_summaries(self) -> List[Tuple[str, int, Dict[str, Any]]]:
+        """Restituisce (evento, canale log, riepilogo) per le finestre scadute."""
+        now = time.monotonic()
+        due = []
+        for key, summary in list(self._summaries.items()):
+            if now - summary['start'] >= summary['window']:
+                del self._summaries[key]
+                due.append((key[0], key[1], summary))
+        for key, counter in list(self._counters.items()):
+            rule = self._rules.get(key[0])
+            if rule is None or now - counter[0] >= rule.window:
+                del self._counters[key]
+        return due
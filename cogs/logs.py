@@ -1,61 +1,320 @@
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord import app_commands
 import json
 import os
+import io
 import asyncio
 from datetime import datetime, timezone, timedelta
+from types import MappingProxyType
+from discord.flags import alias_flag_value
 from .console_logger import logger
+from .log_archive import LogArchive
+from .log_rules import LogRuleEngine, RULE_SEND
+from bot_utils import owner_or_has_permissions
 
 
 BASE_DIR = os.path.dirname(__file__)
-LOG_JSON = os.path.join(BASE_DIR, 'log.json')
+LOG_JSON = os.path.join(BASE_DIR, '..', 'logs.json')
+# Vecchie posizioni del file (qui salvava `/logs set`), migrate in LOG_JSON all'avvio
+LEGACY_LOG_JSON = (os.path.join(BASE_DIR, 'log.json'), os.path.join(BASE_DIR, '..', 'log.json'))
+CONFIG_JSON = os.path.join(BASE_DIR, '..', 'config.json')
+
+
+def _read_json(path, strict=False):
+    """Legge un file JSON; file mancante -> {}. Con strict un file non valido solleva l'errore."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception:
+        if strict:
+            raise
+        return {}
+
+
+def _file_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _log_json_path():
+    if os.path.exists(LOG_JSON):
+        return LOG_JSON
+    return next((p for p in LEGACY_LOG_JSON if os.path.exists(p)), LOG_JSON)
+
+
+def _atomic_dump(path, data):
+    # scrittura atomica: il watcher non vede mai un file a meta'
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def _migrate_legacy_log_json():
+    """Porta in LOG_JSON le impostazioni rimaste nei vecchi log.json.
+
+    Le chiavi del vecchio file prevalgono, perche' sono quelle usate finora dal
+    bot; il file viene poi rinominato in `.migrated`, cosi' non sovrascrive le
+    modifiche successive.
+    """
+    for legacy in LEGACY_LOG_JSON:
+        if not os.path.exists(legacy):
+            continue
+        try:
+            old = _read_json(legacy, strict=True)
+            current = _read_json(LOG_JSON, strict=True)
+            if isinstance(old, dict) and old:
+                merged = dict(current) if isinstance(current, dict) else {}
+                merged.update(old)
+                if merged != current:
+                    _atomic_dump(LOG_JSON, merged)
+            os.replace(legacy, legacy + '.migrated')
+            logger.info(f'Configurazione log migrata da {legacy} a {LOG_JSON}')
+        except Exception as e:
+            logger.error(f'Migrazione di {legacy} fallita: {e}')
+
+
+def _normalize_channel_ids(data):
+    """Converte una volta sola tutti i `*_channel_id` in int (None se non validi)."""
+    out = {}
+    for k, v in data.items():
+        if k.endswith('_channel_id'):
+            try:
+                v = int(v) if v not in (None, '') else None
+            except (TypeError, ValueError):
+                v = None
+        out[k] = v
+    return out
+
+
+def _build_permission_table():
+    """Mappa bit -> nome leggibile, preferendo il nome canonico agli alias."""
+    table = {}
+    for name, value in discord.Permissions.VALID_FLAGS.items():
+        is_alias = isinstance(discord.Permissions.__dict__.get(name), alias_flag_value)
+        if value not in table or not is_alias:
+            table[value] = name.replace('_', ' ')
+    return table
+
+
+PERMISSION_NAMES = _build_permission_table()
+PERM_GROUP_DELAY = 2.0
+
+
+def _permission_names(mask):
+    names = []
+    while mask:
+        low = mask & -mask
+        name = PERMISSION_NAMES.get(low)
+        if name:
+            names.append(name)
+        mask ^= low
+    return names
+
+
+def _overwrite_bits(channel):
+    """Overwrite di un canale come {target_id: (allow, deny, tipo)}; tipo 0 = ruolo, 1 = membro."""
+    out = {}
+    for target, ow in channel.overwrites.items():
+        allow, deny = ow.pair()
+        # target non in cache: discord.py restituisce un Object con `type` Role o Member
+        is_role = isinstance(target, discord.Role) or getattr(target, 'type', None) is discord.Role
+        out[target.id] = (allow.value, deny.value, 0 if is_role else 1)
+    return out
+
+
+class LogConfigSnapshot:
+    """Configurazione di log pre-parsata e di sola lettura.
+
+    Viene sostituita in blocco quando cambiano i file su disco; gli handler
+    leggono solo i mapping gia' pronti e la cache dei canali risolti.
+    """
+    __slots__ = ('log', 'config', 'mtimes', 'channels')
+
+    def __init__(self, log, config, mtimes):
+        self.log = MappingProxyType(_normalize_channel_ids(log))
+        self.config = MappingProxyType(_normalize_channel_ids(config))
+        self.mtimes = mtimes
+        self.channels = {}
+
+    @staticmethod
+    def current_mtimes():
+        log_path = _log_json_path()
+        return (log_path, _file_mtime(log_path), _file_mtime(CONFIG_JSON))
+
+    @classmethod
+    def load(cls, strict=True):
+        """Con strict un file non valido solleva l'errore invece di produrre uno snapshot vuoto."""
+        mtimes = cls.current_mtimes()
+        return cls(_read_json(mtimes[0], strict), _read_json(CONFIG_JSON, strict), mtimes)
+
 
 class LogCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.config = {}
-        self.log_config = {}
-        with open('./config.json', 'r', encoding='utf-8') as f:
-            self.config = json.load(f)
-        self.log_config = {}
-        if os.path.exists(LOG_JSON):
-            try:
-                with open(LOG_JSON, 'r', encoding='utf-8') as f:
-                    self.log_config = json.load(f)
-            except Exception:
-                self.log_config = {}
-        elif os.path.exists('log.json'):
+        _migrate_legacy_log_json()
+        self.rules = LogRuleEngine()
+        self._perm_groups = {}
+        # mtime dell'ultimo file non valido: evita di ripetere l'errore a ogni giro del watcher
+        self._rejected_mtimes = None
+        try:
+            self._set_snapshot(LogConfigSnapshot.load())
+        except Exception as e:
+            logger.error(f'Configurazione log non valida, uso valori vuoti: {e}')
+            self._set_snapshot(LogConfigSnapshot.load(strict=False))
+        self.config_watcher.start()
+        self.rules_summary_flush.start()
+        self.archive = None
+        try:
+            self.archive = LogArchive()
+            self.archive_flush.start()
+        except Exception as e:
+            logger.error(f'Errore inizializzazione archivio log: {e}')
+
+    def cog_unload(self):
+        try:
+            if self.config_watcher.is_running():
+                self.config_watcher.cancel()
+            if self.rules_summary_flush.is_running():
+                self.rules_summary_flush.cancel()
+            if self.archive_flush.is_running():
+                self.archive_flush.cancel()
+            if self.archive:
+                self.archive.flush()
+        except Exception as e:
+            logger.error(f'Errore flush archivio log: {e}')
+
+    @tasks.loop(seconds=10)
+    async def archive_flush(self):
+        try:
+            await asyncio.to_thread(self.archive.flush)
+        except Exception as e:
+            logger.error(f'Errore scrittura archivio log: {e}')
+
+    def _archive_event(self, event, guild, kwargs):
+        """Accoda l'evento all'archivio su disco (la scrittura avviene in archive_flush)."""
+        if not self.archive or not event:
+            return
+        try:
+            # 'id' identifica l'utente solo negli eventi che riguardano un membro
+            user_id = kwargs.get('id') if ('mention' in kwargs or 'member' in kwargs) else None
+            fields = {k: v for k, v in kwargs.items() if k not in ('avatar', 'author_icon')}
+            self.archive.record(event, guild_id=getattr(guild, 'id', None), user_id=user_id, **fields)
+        except Exception as e:
+            logger.error(f'Errore archiviazione evento {event}: {e}')
+
+    @property
+    def log_config(self):
+        return self._snapshot.log
+
+    @property
+    def config(self):
+        return self._snapshot.config
+
+    def _set_snapshot(self, snapshot):
+        self._snapshot = snapshot
+        try:
+            self.rules.load(snapshot.log.get('event_rules'))
+        except Exception as e:
+            logger.error(f'Errore compilazione event_rules: {e}')
+
+    def reload_config(self, force=False):
+        """Ricarica la configurazione solo se i file sono cambiati (mtime)."""
+        try:
+            if force or LogConfigSnapshot.current_mtimes() != self._snapshot.mtimes:
+                self._set_snapshot(LogConfigSnapshot.load())
+                return True
+        except Exception as e:
+            # file non valido: resta attivo lo snapshot precedente
+            logger.error(f'Errore nel caricamento di logs.json: {e}')
+        return False
+
+    @tasks.loop(seconds=5)
+    async def config_watcher(self):
+        try:
+            mtimes = await asyncio.to_thread(LogConfigSnapshot.current_mtimes)
+            if mtimes == self._snapshot.mtimes or mtimes == self._rejected_mtimes:
+                return
+            # Parsing fuori dal loop, poi swap atomico dello snapshot (solo se il parsing riesce)
             try:
-                with open('log.json', 'r', encoding='utf-8') as f:
-                    self.log_config = json.load(f)
-                try:
-                    with open(LOG_JSON, 'w', encoding='utf-8') as f:
-                        json.dump(self.log_config, f, indent=2, ensure_ascii=False)
-                except Exception:
-                    pass
-            except Exception:
-                self.log_config = {}
+                snapshot = await asyncio.to_thread(LogConfigSnapshot.load)
+            except ValueError as e:
+                self._rejected_mtimes = mtimes
+                logger.error(f'Configurazione log non valida, mantengo quella precedente: {e}')
+                return
+            self._rejected_mtimes = None
+            self._set_snapshot(snapshot)
+            logger.info('Configurazione log ricaricata')
+        except Exception as e:
+            logger.error(f'Errore controllo configurazione log: {e}')
 
-    def reload_config(self):
+    def _passes_rules(self, event, member, channels, log_channel_key):
+        """Applica event_rules prima di costruire l'embed; False se l'evento va scartato o riassunto."""
         try:
-            if os.path.exists(LOG_JSON):
-                with open(LOG_JSON, 'r', encoding='utf-8') as f:
-                    self.log_config = json.load(f)
-            elif os.path.exists('log.json'):
-                with open('log.json', 'r', encoding='utf-8') as f:
-                    self.log_config = json.load(f)
+            result = self.rules.check(
+                event,
+                user_id=member.id,
+                channel_ids=tuple(c.id for c in channels if c is not None),
+                role_ids=(r.id for r in getattr(member, 'roles', ())),
+                log_channel_id=self.log_config.get(log_channel_key),
+                label=member.mention
+            )
+            return result == RULE_SEND
+        except Exception as e:
+            logger.error(f'Errore valutazione event_rules per {event}: {e}')
+            return True
+
+    @tasks.loop(seconds=15)
+    async def rules_summary_flush(self):
+        try:
+            for event, channel_id, summary in self.rules.due_summaries():
+                top = sorted(summary['users'].items(), key=lambda kv: kv[1], reverse=True)[:10]
+                users = '\n'.join(f'{label}: {count}' for label, count in top) or 'N/D'
+                channel = self._get_log_channel(channel_id)
+                await self._send_log_embed(
+                    channel_id,
+                    self.log_config.get('event_summary_message') or {
+                        'title': 'Riepilogo eventi',
+                        'description': '{count} eventi **{type}** negli ultimi {window}s.\n{users}',
+                        'color': 0x95A5A6
+                    },
+                    event=f'{event}_summary',
+                    guild=getattr(channel, 'guild', None),
+                    type=event,
+                    count=summary['count'],
+                    window=summary['window'],
+                    users=users
+                )
         except Exception as e:
-            logger.error(f'Errore nel caricamento di log.json: {e}')
-            self.log_config = {}
+            logger.error(f'Errore invio riepilogo eventi: {e}')
 
-    def _save_log_config(self):
+    def _save_log_config(self, data):
         try:
-            with open(LOG_JSON, 'w', encoding='utf-8') as f:
-                json.dump(self.log_config, f, indent=2, ensure_ascii=False)
+            _atomic_dump(LOG_JSON, data)
+            self.reload_config(force=True)
         except Exception as e:
             logger.error(f'Errore salvataggio log_config: {e}')
 
+    def _get_log_channel(self, channel_id):
+        """Risolve un canale di log usando la cache dello snapshot corrente."""
+        if not channel_id:
+            return None
+        cache = self._snapshot.channels
+        channel = cache.get(channel_id)
+        if channel is None:
+            try:
+                channel = self.bot.get_channel(int(channel_id))
+            except (TypeError, ValueError):
+                return None
+            if channel is not None:
+                cache[channel_id] = channel
+        return channel
+
     # Gruppo comandi slash per configurare i canali di log
     logs_group = app_commands.Group(name='logs', description='Gestione canali di log')
 
@@ -73,11 +332,48 @@ class LogCog(commands.Cog):
     ])
     async def logs_set(self, interaction: discord.Interaction, tipo: app_commands.Choice[str], channel: discord.TextChannel):
         self.reload_config()
-        key = tipo.value
-        self.log_config[key] = channel.id
-        self._save_log_config()
+        data = dict(self.log_config)
+        data[tipo.value] = channel.id
+        self._save_log_config(data)
         await interaction.response.send_message(f'✅ Set {tipo.name} log → {channel.mention}', ephemeral=True)
 
+    @logs_group.command(name='search', description="Cerca negli eventi di log archiviati")
+    @app_commands.describe(tipo='Tipo evento (es. ban, message_delete, vc_join)', utente='Utente coinvolto', testo='Testo da cercare', limite='Numero massimo di risultati (1-25)')
+    @owner_or_has_permissions(manage_guild=True)
+    async def logs_search(self, interaction: discord.Interaction, tipo: str = None, utente: discord.User = None, testo: str = None, limite: int = 10):
+        if not self.archive:
+            await interaction.response.send_message('❌ Archivio log non disponibile.', ephemeral=True)
+            return
+        await interaction.response.defer(ephemeral=True)
+        limite = max(1, min(25, limite))
+        try:
+            await asyncio.to_thread(self.archive.flush)
+            results = await asyncio.to_thread(
+                self.archive.search,
+                guild_id=interaction.guild_id,
+                user_id=utente.id if utente else None,
+                event=tipo,
+                text=testo,
+                limit=limite
+            )
+        except Exception as e:
+            logger.error(f'Errore ricerca archivio log: {e}')
+            await interaction.followup.send('❌ Errore durante la ricerca.', ephemeral=True)
+            return
+        if not results:
+            await interaction.followup.send('ℹ️ Nessun evento trovato.', ephemeral=True)
+            return
+        lines = []
+        for entry in results:
+            ts = entry.get('ts', '')[:19].replace('T', ' ')
+            who = f"<@{entry['user_id']}>" if entry.get('user_id') else entry.get('channel') or entry.get('name') or entry.get('id', '')
+            detail = entry.get('reason') or entry.get('changes') or entry.get('content') or entry.get('staffer') or ''
+            line = f"`{ts}` **{entry.get('event')}** {who} {detail}".strip()
+            lines.append(line[:300])
+        embed = discord.Embed(title='🔎 Ricerca log', description='\n'.join(lines)[:4000], color=0x3498DB)
+        embed.set_footer(text=f'{len(results)} risultati')
+        await interaction.followup.send(embed=embed, ephemeral=True)
+
     @logs_group.command(name='config', description='Mostra la configurazione dei canali di log')
     async def logs_config(self, interaction: discord.Interaction):
         self.reload_config()
@@ -133,65 +429,50 @@ class LogCog(commands.Cog):
         except Exception:
             return 'Sistema'
 
-    def _format_permissions_diff(self, before_overwrites, after_overwrites):
-        """
-        Supports two input types:
-        - Channel overwrites: dict[target -> discord.PermissionOverwrite]
-          Returns: multiline string describing changes.
-        - Role/Member permissions: discord.Permissions vs discord.Permissions
-          Returns: tuple (added_perms_str, removed_perms_str)
-        """
-        # Case 1: channel overwrites (dict of PermissionOverwrite)
-        if isinstance(before_overwrites, dict) and isinstance(after_overwrites, dict):
-            changes = []
-            all_targets = set(before_overwrites.keys()) | set(after_overwrites.keys())
-            for target in all_targets:
-                b_over = before_overwrites.get(target)
-                a_over = after_overwrites.get(target)
-                if b_over is None and a_over is not None:
-                    try:
-                        allow, deny = a_over.pair()  # both are discord.Permissions
-                    except Exception:
-                        # Fallback: treat as empty
-                        allow, deny = discord.Permissions.none(), discord.Permissions.none()
-                    allow_perms = [p.replace('_', ' ') for p in discord.Permissions.VALID_FLAGS if getattr(allow, p)]
-                    deny_perms = [p.replace('_', ' ') for p in discord.Permissions.VALID_FLAGS if getattr(deny, p)]
-                    if allow_perms or deny_perms:
-                        changes.append(f"Aggiunto overwrite per {getattr(target, 'mention', str(target))}: Allow {', '.join(allow_perms) or 'Nessuno'}, Deny {', '.join(deny_perms) or 'Nessuno'}")
-                elif a_over is None and b_over is not None:
-                    changes.append(f"Rimosso overwrite per {getattr(target, 'mention', str(target))}")
-                else:
-                    try:
-                        b_allow, b_deny = b_over.pair()
-                        a_allow, a_deny = a_over.pair()
-                    except Exception:
-                        b_allow = b_deny = discord.Permissions.none()
-                        a_allow = a_deny = discord.Permissions.none()
-                    added_allow = [p.replace('_', ' ') for p in discord.Permissions.VALID_FLAGS if getattr(a_allow, p) and not getattr(b_allow, p)]
-                    removed_allow = [p.replace('_', ' ') for p in discord.Permissions.VALID_FLAGS if getattr(b_allow, p) and not getattr(a_allow, p)]
-                    added_deny = [p.replace('_', ' ') for p in discord.Permissions.VALID_FLAGS if getattr(a_deny, p) and not getattr(b_deny, p)]
-                    removed_deny = [p.replace('_', ' ') for p in discord.Permissions.VALID_FLAGS if getattr(b_deny, p) and not getattr(a_deny, p)]
-                    if added_allow or removed_allow or added_deny or removed_deny:
-                        change_parts = []
-                        if added_allow:
-                            change_parts.append(f"Allow aggiunti: {', '.join(added_allow)}")
-                        if removed_allow:
-                            change_parts.append(f"Allow rimossi: {', '.join(removed_allow)}")
-                        if added_deny:
-                            change_parts.append(f"Deny aggiunti: {', '.join(added_deny)}")
-                        if removed_deny:
-                            change_parts.append(f"Deny rimossi: {', '.join(removed_deny)}")
-                        changes.append(f"Modificato overwrite per {getattr(target, 'mention', str(target))}: {'; '.join(change_parts)}")
-            return '\n'.join(changes) if changes else ''
-
-        # Case 2: plain Permissions comparison for roles
-        if isinstance(before_overwrites, discord.Permissions) and isinstance(after_overwrites, discord.Permissions):
-            added = [p.replace('_', ' ') for p in discord.Permissions.VALID_FLAGS if getattr(after_overwrites, p) and not getattr(before_overwrites, p)]
-            removed = [p.replace('_', ' ') for p in discord.Permissions.VALID_FLAGS if getattr(before_overwrites, p) and not getattr(after_overwrites, p)]
-            return (', '.join(added) or 'Nessuno', ', '.join(removed) or 'Nessuno')
-
-        # Unknown types
-        return ''
+    def _overwrite_target_mention(self, guild, target_id, target_type):
+        if guild is not None and target_id == guild.id:
+            return '@everyone'
+        return f'<@{target_id}>' if target_type == 1 else f'<@&{target_id}>'
+
+    def _diff_overwrite_bits(self, before_bits, after_bits, guild=None):
+        """Confronta overwrite {id: (allow, deny, tipo)} con XOR sui bitfield."""
+        changes = []
+        for target_id in before_bits.keys() | after_bits.keys():
+            b = before_bits.get(target_id)
+            a = after_bits.get(target_id)
+            if b is not None and a is not None and b[0] == a[0] and b[1] == a[1]:
+                continue
+            mention = self._overwrite_target_mention(guild, target_id, (a or b)[2])
+            if b is None:
+                allow_perms = _permission_names(a[0])
+                deny_perms = _permission_names(a[1])
+                if allow_perms or deny_perms:
+                    changes.append(f"Aggiunto overwrite per {mention}: Allow {', '.join(allow_perms) or 'Nessuno'}, Deny {', '.join(deny_perms) or 'Nessuno'}")
+            elif a is None:
+                changes.append(f"Rimosso overwrite per {mention}")
+            else:
+                allow_diff = b[0] ^ a[0]
+                deny_diff = b[1] ^ a[1]
+                change_parts = []
+                if allow_diff & a[0]:
+                    change_parts.append(f"Allow aggiunti: {', '.join(_permission_names(allow_diff & a[0]))}")
+                if allow_diff & b[0]:
+                    change_parts.append(f"Allow rimossi: {', '.join(_permission_names(allow_diff & b[0]))}")
+                if deny_diff & a[1]:
+                    change_parts.append(f"Deny aggiunti: {', '.join(_permission_names(deny_diff & a[1]))}")
+                if deny_diff & b[1]:
+                    change_parts.append(f"Deny rimossi: {', '.join(_permission_names(deny_diff & b[1]))}")
+                if change_parts:
+                    changes.append(f"Modificato overwrite per {mention}: {'; '.join(change_parts)}")
+        changes.sort()
+        return '\n'.join(changes)
+
+    def _format_permissions_diff(self, before_perms, after_perms):
+        """Confronta due discord.Permissions; restituisce (permessi aggiunti, permessi rimossi)."""
+        diff = before_perms.value ^ after_perms.value
+        added = _permission_names(diff & after_perms.value)
+        removed = _permission_names(diff & before_perms.value)
+        return (', '.join(added) or 'Nessuno', ', '.join(removed) or 'Nessuno')
 
     def _get_channel_type_name(self, channel):
         if isinstance(channel, discord.TextChannel):
@@ -205,11 +486,11 @@ class LogCog(commands.Cog):
         else:
             return 'Sconosciuto'
 
-    async def _send_log_embed(self, channel_id, embed_config, guild=None, **kwargs):
+    async def _send_log_embed(self, channel_id, embed_config, guild=None, file=None, event=None, **kwargs):
         try:
-            if not channel_id:
-                return
-            channel = self.bot.get_channel(int(channel_id))
+            # l'archivio registra ogni evento, anche senza un canale di log configurato
+            channel = self._get_log_channel(channel_id)
+            self._archive_event(event, guild or getattr(channel, 'guild', None), kwargs)
             if not channel:
                 return
             cfg = embed_config or {}
@@ -276,7 +557,10 @@ class LogCog(commands.Cog):
                     except Exception:
                         pass
             embed.timestamp = datetime.now(timezone.utc)
-            await channel.send(embed=embed)
+            if file is not None:
+                await channel.send(embed=embed, file=file)
+            else:
+                await channel.send(embed=embed)
         except Exception as e:
             logger.error(f'Errore invio embed log: {e}')
     @commands.Cog.listener()
@@ -284,9 +568,11 @@ class LogCog(commands.Cog):
         try:
             cfg = self.log_config.get('join_message', {})
             channel_id = self.log_config.get('join_log_channel_id') or self.config.get('join_log_channel_id')
-            if not channel_id:
+            if self.archive:
+                self.archive.record('join', guild_id=member.guild.id, user_id=member.id, mention=member.mention, username=member.name)
+            channel = self._get_log_channel(channel_id)
+            if not channel:
                 return
-            channel = member.guild.get_channel(int(channel_id))
 
             joined_at = self._format_datetime(member.joined_at)
             created_at = self._format_datetime(member.created_at)
@@ -331,11 +617,7 @@ class LogCog(commands.Cog):
         try:
             cfg = self.log_config.get('leave_message', {})
             channel_id = self.log_config.get('leave_log_channel_id') or self.config.get('leave_log_channel_id')
-            if not channel_id:
-                return
-            channel = member.guild.get_channel(int(channel_id))
-            if not channel:
-                return
+            channel = self._get_log_channel(channel_id)
 
             left_dt = datetime.now(timezone.utc)
             left_at = self._format_datetime(left_dt)
@@ -399,10 +681,15 @@ class LogCog(commands.Cog):
             except Exception:
                 pass
 
+            if self.archive:
+                self.archive.record('kick' if is_kick else 'leave', guild_id=member.guild.id, user_id=member.id, mention=member.mention, username=member.name, time_in_server=time_in_server)
+            if not channel:
+                return
+
             await asyncio.sleep(5)
             if is_kick:
                 kick_channel_id = self.log_config.get('kicks_log_channel_id') or channel_id
-                kick_channel = member.guild.get_channel(int(kick_channel_id)) if kick_channel_id else channel
+                kick_channel = self._get_log_channel(kick_channel_id) or channel
                 try:
                     await kick_channel.send(embed=embed)
                 except Exception:
@@ -432,6 +719,7 @@ class LogCog(commands.Cog):
             await self._send_log_embed(
                 self.log_config.get('moderation_log_channel_id'),
                 self.log_config.get('ban_message', {}),
+                event='ban',
                 guild=guild,
                 mention=user.mention,
                 id=user.id,
@@ -454,6 +742,7 @@ class LogCog(commands.Cog):
             await self._send_log_embed(
                 self.log_config.get('moderation_log_channel_id'),
                 self.log_config.get('unban_message', {}),
+                event='unban',
                 guild=guild,
                 mention=user.mention,
                 id=user.id,
@@ -489,33 +778,60 @@ class LogCog(commands.Cog):
                 changes.append(f"Posizione: `{before.position}` → `{after.position}`")
 
             perm_changes = ""
-            if before.overwrites != after.overwrites:
-                perm_changes = self._format_permissions_diff(before.overwrites, after.overwrites)
+            before_bits = _overwrite_bits(before)
+            after_bits = _overwrite_bits(after)
+            if before_bits != after_bits:
+                perm_changes = self._diff_overwrite_bits(before_bits, after_bits, after.guild)
                 if perm_changes:
+                    # Solo permessi cambiati in un canale con categoria: probabile sync,
+                    # raggruppa i canali fratelli con lo stesso diff in un'unica voce
+                    if not changes and getattr(after, 'category_id', None):
+                        await self._queue_permission_group(after, perm_changes)
+                        return
                     changes.append(f"Permessi aggiornati:\n{perm_changes}")
 
             if changes:
-                staffer = await self._get_audit_user(
-                    discord.AuditLogAction.channel_update, after.id, after.guild
-                )
-
-                formatted_changes = "\n".join(changes)
-                logger.info(f"Channel updated: {after.name} ({after.id}) by {staffer} - Changes:\n{formatted_changes}")
-
-                await self._send_log_embed(
-                    self.log_config.get("moderation_log_channel_id"),
-                    self.log_config.get("channel_update_message", {}),
-                    guild=after.guild,
-                    channel=after.mention,
-                    id=after.id,
-                    staffer=staffer,
-                    total_members=after.guild.member_count,
-                    changes=formatted_changes
-                )
+                await self._send_channel_update([after], "\n".join(changes))
 
         except Exception as e:
             logger.error(f"Errore in on_guild_channel_update: {e}")
 
+    async def _queue_permission_group(self, channel, perm_changes):
+        key = (channel.guild.id, channel.category_id, perm_changes)
+        group = self._perm_groups.get(key)
+        if group is not None:
+            group.append(channel)
+            return
+        self._perm_groups[key] = [channel]
+        await asyncio.sleep(PERM_GROUP_DELAY)
+        channels = self._perm_groups.pop(key, [channel])
+        if len(channels) == 1:
+            await self._send_channel_update(channels, f"Permessi aggiornati:\n{perm_changes}")
+        else:
+            category = channel.category
+            where = f" in {category.mention}" if category else ""
+            await self._send_channel_update(channels, f"Permessi aggiornati su {len(channels)} canali{where}:\n{perm_changes}")
+
+    async def _send_channel_update(self, channels, formatted_changes):
+        first = channels[0]
+        staffer = await self._get_audit_user(
+            discord.AuditLogAction.channel_update, first.id, first.guild
+        )
+        names = ', '.join(c.name for c in channels)
+        logger.info(f"Channel updated: {names} ({first.id}) by {staffer} - Changes:\n{formatted_changes}")
+
+        await self._send_log_embed(
+            self.log_config.get("moderation_log_channel_id"),
+            self.log_config.get("channel_update_message", {}),
+            event="channel_update",
+            guild=first.guild,
+            channel=', '.join(c.mention for c in channels),
+            id=first.id,
+            staffer=staffer,
+            total_members=first.guild.member_count,
+            changes=formatted_changes
+        )
+
     @commands.Cog.listener()
     async def on_guild_role_update(self, before: discord.Role, after: discord.Role):
         try:
@@ -526,6 +842,7 @@ class LogCog(commands.Cog):
                 await self._send_log_embed(
                     self.log_config.get('moderation_log_channel_id'),
                     self.log_config.get('role_permission_update_message', {}),
+                    event='role_permission_update',
                     guild=after.guild,
                     role=after.mention,
                     id=after.id,
@@ -559,6 +876,7 @@ class LogCog(commands.Cog):
                     await self._send_log_embed(
                         self.log_config.get('moderation_log_channel_id'),
                         self.log_config.get('mute_message', {}),
+                        event='mute',
                         guild=after.guild,
                         mention=after.mention,
                         id=after.id,
@@ -576,6 +894,7 @@ class LogCog(commands.Cog):
                     await self._send_log_embed(
                         self.log_config.get('moderation_log_channel_id'),
                         self.log_config.get('unmute_message', {}),
+                        event='unmute',
                         guild=after.guild,
                         mention=after.mention,
                         id=after.id,
@@ -592,6 +911,7 @@ class LogCog(commands.Cog):
                 await self._send_log_embed(
                     self.log_config.get('moderation_log_channel_id'),
                     self.log_config.get('nick_message', {}),
+                    event='nick',
                     guild=after.guild,
                     mention=after.mention,
                     id=after.id,
@@ -614,6 +934,7 @@ class LogCog(commands.Cog):
                     await self._send_log_embed(
                         self.log_config.get('moderation_log_channel_id'),
                         self.log_config.get('role_change_message', {}),
+                        event='role_change',
                         guild=after.guild,
                         mention=after.mention,
                         id=after.id,
@@ -630,6 +951,7 @@ class LogCog(commands.Cog):
                 await self._send_log_embed(
                     self.log_config.get('boost_log_channel_id'),
                     self.log_config.get('boost_message', {}),
+                    event='boost',
                     guild=after.guild,
                     mention=after.mention,
                     id=after.id,
@@ -646,11 +968,14 @@ class LogCog(commands.Cog):
         try:
             if message.author.bot:
                 return
+            if not self._passes_rules('message_delete', message.author, (message.channel, getattr(message.channel, 'category', None)), 'message_log_channel_id'):
+                return
             content = message.content or 'Nessun contenuto'
             logger.info(f'Message deleted: {message.author.name} ({message.author.id}) in {message.channel.name} - Content: {content[:100]}...')
             await self._send_log_embed(
                 self.log_config.get('message_log_channel_id'),
                 self.log_config.get('message_delete_message', {}),
+                event='message_delete',
                 guild=message.guild,
                 mention=message.author.mention,
                 id=message.author.id,
@@ -669,12 +994,15 @@ class LogCog(commands.Cog):
         try:
             if before.author.bot or before.content == after.content:
                 return
+            if not self._passes_rules('message_edit', before.author, (before.channel, getattr(before.channel, 'category', None)), 'message_log_channel_id'):
+                return
             old_content = before.content or 'Nessun contenuto'
             new_content = after.content or 'Nessun contenuto'
             logger.info(f'Message edited: {before.author.name} ({before.author.id}) in {before.channel.name} - Old: {old_content[:50]}..., New: {new_content[:50]}...')
             await self._send_log_embed(
                 self.log_config.get('message_log_channel_id'),
                 self.log_config.get('message_edit_message', {}),
+                event='message_edit',
                 guild=before.guild,
                 mention=before.author.mention,
                 id=before.author.id,
@@ -689,10 +1017,74 @@ class LogCog(commands.Cog):
         except Exception as e:
             logger.error(f'Errore in on_message_edit: {e}')
 
+    def _build_bulk_delete_report(self, channel, message_ids, cached_messages):
+        """Costruisce in memoria il report testuale di una eliminazione di massa."""
+        cached_by_id = {m.id: m for m in cached_messages}
+        channel_name = getattr(channel, 'name', None) or 'sconosciuto'
+        lines = [
+            f"===== ELIMINAZIONE DI MASSA #{channel_name} =====",
+            f"Messaggi eliminati: {len(message_ids)} (in cache: {len(cached_by_id)})",
+            f"Data: {self._format_datetime(datetime.now(timezone.utc))} UTC",
+            "",
+        ]
+        for mid in sorted(message_ids):
+            msg = cached_by_id.get(mid)
+            if msg is None:
+                lines.append(f"[{mid}] <messaggio non in cache>")
+                continue
+            ts = self._format_datetime(msg.created_at)
+            content = msg.content or 'Nessun contenuto'
+            lines.append(f"[{ts}] {msg.author} ({msg.author.id}): {content}")
+            for att in msg.attachments:
+                lines.append(f"    [ALLEGATO] {att.filename} -> {att.url}")
+            if msg.embeds:
+                lines.append(f"    [EMBED] {len(msg.embeds)}")
+        data = '\n'.join(lines).encode('utf-8')
+        return discord.File(io.BytesIO(data), filename=f"bulk_delete_{getattr(channel, 'id', 'unknown')}.txt")
+
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(self, payload: discord.RawBulkMessageDeleteEvent):
+        try:
+            if payload.guild_id is None:
+                return
+            guild = self.bot.get_guild(payload.guild_id)
+            if guild is None:
+                return
+            channel = guild.get_channel_or_thread(payload.channel_id)
+            count = len(payload.message_ids)
+            cached = [m for m in payload.cached_messages if not m.author.bot]
+            authors = {m.author.id for m in cached}
+            staffer = await self._get_audit_user(discord.AuditLogAction.message_bulk_delete, payload.channel_id, guild)
+            channel_mention = getattr(channel, 'mention', f'<#{payload.channel_id}>')
+            logger.info(f'Bulk message delete: {count} messages in {getattr(channel, "name", payload.channel_id)} by {staffer}')
+            report = self._build_bulk_delete_report(channel, payload.message_ids, payload.cached_messages)
+            cfg = self.log_config.get('message_bulk_delete_message') or {
+                'title': 'Eliminazione messaggi di massa',
+                'description': '{count} messaggi eliminati in {channel} da {staffer}.\nAutori coinvolti: {authors}',
+                'color': 0xE74C3C,
+                'footer': 'Canale ID: {id}'
+            }
+            await self._send_log_embed(
+                self.log_config.get('message_log_channel_id'),
+                cfg,
+                event='message_bulk_delete',
+                guild=guild,
+                file=report,
+                count=count,
+                channel=channel_mention,
+                id=payload.channel_id,
+                staffer=staffer,
+                authors=len(authors),
+                total_members=guild.member_count
+            )
+        except Exception as e:
+            logger.error(f'Errore in on_raw_bulk_message_delete: {e}')
+
     async def log_warn(self, member: discord.Member, reason: str, staffer: str, total_warns: int):
         await self._send_log_embed(
             self.log_config.get('moderation_log_channel_id'),
             self.log_config.get('warn_message', {}),
+            event='warn',
             mention=member.mention,
             id=member.id,
             avatar=member.display_avatar.url,
@@ -708,6 +1100,7 @@ class LogCog(commands.Cog):
         await self._send_log_embed(
             self.log_config.get('moderation_log_channel_id'),
             self.log_config.get('unwarn_message', {}),
+            event='unwarn',
             mention=member.mention,
             id=member.id,
             avatar=member.display_avatar.url,
@@ -722,6 +1115,7 @@ class LogCog(commands.Cog):
         await self._send_log_embed(
             self.log_config.get('moderation_log_channel_id'),
             self.log_config.get('clearwarns_message', {}),
+            event='clearwarns',
             mention=member.mention,
             id=member.id,
             avatar=member.display_avatar.url,
@@ -736,6 +1130,7 @@ class LogCog(commands.Cog):
         await self._send_log_embed(
             self.log_config.get('ticket_log_channel_id'),
             self.log_config.get('ticket_open_message', {}),
+            event='ticket_open',
             mention=member.mention,
             id=member.id,
             avatar=member.display_avatar.url,
@@ -751,6 +1146,7 @@ class LogCog(commands.Cog):
         await self._send_log_embed(
             self.log_config.get('ticket_log_channel_id'),
             self.log_config.get('ticket_close_message', {}),
+            event='ticket_close',
             name=channel_name,
             opener=opener,
             staffer=staffer,
@@ -762,6 +1158,7 @@ class LogCog(commands.Cog):
         await self._send_log_embed(
             self.log_config.get('ticket_log_channel_id'),
             self.log_config.get('ticket_rename_message', {}),
+            event='ticket_rename',
             channel=channel_mention,
             new_name=new_name,
             number=number,
@@ -773,6 +1170,7 @@ class LogCog(commands.Cog):
         await self._send_log_embed(
             self.log_config.get('ticket_log_channel_id'),
             self.log_config.get('ticket_add_message', {}),
+            event='ticket_add',
             member=member.mention,
             channel=channel,
             number=number,
@@ -788,6 +1186,7 @@ class LogCog(commands.Cog):
         await self._send_log_embed(
             self.log_config.get('ticket_log_channel_id'),
             self.log_config.get('ticket_remove_message', {}),
+            event='ticket_remove',
             member=member.mention,
             channel=channel,
             number=number,
@@ -803,6 +1202,7 @@ class LogCog(commands.Cog):
         await self._send_log_embed(
             self.log_config.get('autorole_log_channel_id'),
             self.log_config.get('autorole_add_message', {}),
+            event='autorole_add',
             mention=member.mention,
             id=member.id,
             avatar=member.display_avatar.url,
@@ -816,6 +1216,7 @@ class LogCog(commands.Cog):
         await self._send_log_embed(
             self.log_config.get('autorole_log_channel_id'),
             self.log_config.get('autorole_remove_message', {}),
+            event='autorole_remove',
             mention=member.mention,
             id=member.id,
             avatar=member.display_avatar.url,
@@ -829,6 +1230,7 @@ class LogCog(commands.Cog):
         await self._send_log_embed(
             self.log_config.get('automod_log_channel_id'),
             self.log_config.get('automod_mute_message', {}),
+            event='automod_mute',
             mention=member.mention,
             id=member.id,
             avatar=member.display_avatar.url,
@@ -843,6 +1245,7 @@ class LogCog(commands.Cog):
         await self._send_log_embed(
             self.log_config.get('automod_log_channel_id'),
             self.log_config.get('automod_warn_message', {}),
+            event='automod_warn',
             mention=member.mention,
             id=member.id,
             avatar=member.display_avatar.url,
@@ -860,6 +1263,7 @@ class LogCog(commands.Cog):
             await self._send_log_embed(
                 self.log_config.get('moderation_log_channel_id'),
                 self.log_config.get('channel_create_message', {}),
+                event='channel_create',
                 guild=channel.guild,
                 channel=channel.mention,
                 id=channel.id,
@@ -872,12 +1276,14 @@ class LogCog(commands.Cog):
 
     @commands.Cog.listener()
     async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel):
+        self._snapshot.channels.pop(channel.id, None)
         try:
             staffer = await self._get_audit_user(discord.AuditLogAction.channel_delete, channel.id, channel.guild)
             logger.info(f'Channel deleted: {channel.name} ({channel.id}) by {staffer} - Type: {self._get_channel_type_name(channel)}')
             await self._send_log_embed(
                 self.log_config.get('moderation_log_channel_id'),
                 self.log_config.get('channel_delete_message', {}),
+                event='channel_delete',
                 guild=channel.guild,
                 name=channel.name,
                 id=channel.id,
@@ -896,6 +1302,7 @@ class LogCog(commands.Cog):
             await self._send_log_embed(
                 self.log_config.get('moderation_log_channel_id'),
                 self.log_config.get('thread_create_message', {}),
+                event='thread_create',
                 guild=thread.guild,
                 thread=thread.mention,
                 id=thread.id,
@@ -913,6 +1320,7 @@ class LogCog(commands.Cog):
             await self._send_log_embed(
                 self.log_config.get('moderation_log_channel_id'),
                 self.log_config.get('thread_delete_message', {}),
+                event='thread_delete',
                 guild=thread.guild,
                 name=thread.name,
                 id=thread.id,
@@ -939,6 +1347,7 @@ class LogCog(commands.Cog):
                 await self._send_log_embed(
                     self.log_config.get('moderation_log_channel_id'),
                     self.log_config.get('thread_update_message', {}),
+                    event='thread_update',
                     guild=after.guild,
                     thread=after.mention,
                     id=after.id,
@@ -957,6 +1366,7 @@ class LogCog(commands.Cog):
             await self._send_log_embed(
                 self.log_config.get('moderation_log_channel_id'),
                 self.log_config.get('webhook_create_message', {}),
+                event='webhook_create',
                 guild=webhook.guild,
                 name=webhook.name,
                 id=webhook.id,
@@ -974,6 +1384,7 @@ class LogCog(commands.Cog):
             await self._send_log_embed(
                 self.log_config.get('moderation_log_channel_id'),
                 self.log_config.get('webhook_delete_message', {}),
+                event='webhook_delete',
                 guild=webhook.guild,
                 name=webhook.name,
                 id=webhook.id,
@@ -998,6 +1409,7 @@ class LogCog(commands.Cog):
                 await self._send_log_embed(
                     self.log_config.get('moderation_log_channel_id'),
                     self.log_config.get('webhook_update_message', {}),
+                    event='webhook_update',
                     guild=after.guild,
                     name=after.name,
                     id=after.id,
@@ -1021,6 +1433,7 @@ class LogCog(commands.Cog):
                 await self._send_log_embed(
                     self.log_config.get('moderation_log_channel_id'),
                     self.log_config.get('emoji_create_message', {}),
+                    event='emoji_create',
                     guild=guild,
                     emojis=', '.join([str(e) for e in added]),
                     staffer=staffer,
@@ -1032,6 +1445,7 @@ class LogCog(commands.Cog):
                 await self._send_log_embed(
                     self.log_config.get('moderation_log_channel_id'),
                     self.log_config.get('emoji_delete_message', {}),
+                    event='emoji_delete',
                     guild=guild,
                     emojis=', '.join([e.name for e in removed]),
                     staffer=staffer,
@@ -1043,6 +1457,7 @@ class LogCog(commands.Cog):
                 await self._send_log_embed(
                     self.log_config.get('moderation_log_channel_id'),
                     self.log_config.get('emoji_update_message', {}),
+                    event='emoji_update',
                     guild=guild,
                     emojis=', '.join([str(e) for e in updated]),
                     staffer=staffer,
@@ -1064,6 +1479,7 @@ class LogCog(commands.Cog):
                 await self._send_log_embed(
                     self.log_config.get('moderation_log_channel_id'),
                     self.log_config.get('sticker_create_message', {}),
+                    event='sticker_create',
                     guild=guild,
                     stickers=', '.join([s.name for s in added]),
                     staffer=staffer,
@@ -1075,6 +1491,7 @@ class LogCog(commands.Cog):
                 await self._send_log_embed(
                     self.log_config.get('moderation_log_channel_id'),
                     self.log_config.get('sticker_delete_message', {}),
+                    event='sticker_delete',
                     guild=guild,
                     stickers=', '.join([s.name for s in removed]),
                     staffer=staffer,
@@ -1086,6 +1503,7 @@ class LogCog(commands.Cog):
                 await self._send_log_embed(
                     self.log_config.get('moderation_log_channel_id'),
                     self.log_config.get('sticker_update_message', {}),
+                    event='sticker_update',
                     guild=guild,
                     stickers=', '.join([s.name for s in updated]),
                     staffer=staffer,
@@ -1102,6 +1520,7 @@ class LogCog(commands.Cog):
             await self._send_log_embed(
                 self.log_config.get('moderation_log_channel_id'),
                 self.log_config.get('role_create_message', {}),
+                event='role_create',
                 guild=role.guild,
                 role=role.mention,
                 id=role.id,
@@ -1119,6 +1538,7 @@ class LogCog(commands.Cog):
             await self._send_log_embed(
                 self.log_config.get('moderation_log_channel_id'),
                 self.log_config.get('role_delete_message', {}),
+                event='role_delete',
                 guild=role.guild,
                 name=role.name,
                 id=role.id,
@@ -1153,6 +1573,7 @@ class LogCog(commands.Cog):
                 await self._send_log_embed(
                     self.log_config.get('moderation_log_channel_id'),
                     self.log_config.get('guild_update_message', {}),
+                    event='guild_update',
                     guild=after,
                     name=after.name,
                     id=after.id,
@@ -1168,10 +1589,13 @@ class LogCog(commands.Cog):
         try:
             if before.channel != after.channel:
                 if before.channel is None and after.channel is not None:
+                    if not self._passes_rules('vc_join', member, (after.channel,), 'voice_log_channel_id'):
+                        return
                     logger.info(f'Voice join: {member.name} ({member.id}) joined {after.channel.name}')
                     await self._send_log_embed(
                         self.log_config.get('voice_log_channel_id'),
                         self.log_config.get('vc_join_message', {}),
+                        event='vc_join',
                         guild=member.guild,
                         mention=member.mention,
                         id=member.id,
@@ -1182,10 +1606,13 @@ class LogCog(commands.Cog):
                         channel=after.channel.mention
                     )
                 elif before.channel is not None and after.channel is None:
+                    if not self._passes_rules('vc_leave', member, (before.channel,), 'voice_log_channel_id'):
+                        return
                     logger.info(f'Voice leave: {member.name} ({member.id}) left {before.channel.name}')
                     await self._send_log_embed(
                         self.log_config.get('voice_log_channel_id'),
                         self.log_config.get('vc_leave_message', {}),
+                        event='vc_leave',
                         guild=member.guild,
                         mention=member.mention,
                         id=member.id,
@@ -1196,10 +1623,13 @@ class LogCog(commands.Cog):
                         channel=before.channel.mention
                     )
                 elif before.channel is not None and after.channel is not None:
+                    if not self._passes_rules('vc_move', member, (before.channel, after.channel), 'voice_log_channel_id'):
+                        return
                     logger.info(f'Voice move: {member.name} ({member.id}) moved from {before.channel.name} to {after.channel.name}')
                     await self._send_log_embed(
                         self.log_config.get('voice_log_channel_id'),
                         self.log_config.get('vc_move_message', {}),
+                        event='vc_move',
                         guild=member.guild,
                         mention=member.mention,
                         id=member.id,
@@ -0,0 +1,95 @@
+import heapq
+from typing import Dict, List, Optional, Set, Tuple
+
+IDLE_WARN = 'warn'
+IDLE_CLOSE = 'close'
+
+
+class IdleTracker:
+    """Scadenze di inattivita' dei ticket aperti in un unico heap.
+
+    Ogni ticket ha una sola scadenza valida (`_scheduled`); le voci dell'heap
+    non piu' valide vengono scartate quando arrivano in cima. `touch` aggiorna
+    solo l'ultima attivita' in memoria: la scadenza viene ricalcolata quando
+    la vecchia voce esce dall'heap, quindi i messaggi non toccano l'heap.
+    """
+
+    def __init__(self, warn_after: float, close_after: float):
+        self.warn_after = warn_after
+        self.close_after = close_after
+        self.last_activity: Dict[str, float] = {}
+        # ticket_id -> momento dell'avviso (la chiusura arriva almeno close_after - warn_after dopo)
+        self.warned: Dict[str, float] = {}
+        self._dirty: Set[str] = set()
+        self._scheduled: Dict[str, float] = {}
+        self._heap: List[Tuple[float, str]] = []
+
+    @property
+    def enabled(self) -> bool:
+        return self.close_after > 0
+
+    def _warns(self) -> bool:
+        return 0 < self.warn_after < self.close_after
+
+    def _push(self, ticket_id: str, when: float):
+        self._scheduled[ticket_id] = when
+        heapq.heappush(self._heap, (when, ticket_id))
+
+    def _next_deadline(self, ticket_id: str) -> float:
+        last = self.last_activity[ticket_id]
+        if not self._warns():
+            return last + self.close_after
+        warned_at = self.warned.get(ticket_id)
+        if warned_at is None:
+            return last + self.warn_after
+        return max(last + self.close_after, warned_at + self.close_after - self.warn_after)
+
+    def track(self, ticket_id, last_activity: float, warned_at: Optional[float] = None):
+        if not self.enabled:
+            return
+        ticket_id = str(ticket_id)
+        self.last_activity[ticket_id] = last_activity
+        if warned_at:
+            self.warned[ticket_id] = warned_at
+        else:
+            self.warned.pop(ticket_id, None)
+        self._push(ticket_id, self._next_deadline(ticket_id))
+
+    def touch(self, ticket_id: str, now: float):
+        if ticket_id in self.last_activity:
+            self.last_activity[ticket_id] = now
+            self.warned.pop(ticket_id, None)
+            self._dirty.add(ticket_id)
+
+    def forget(self, ticket_id):
+        ticket_id = str(ticket_id)
+        self.last_activity.pop(ticket_id, None)
+        self.warned.pop(ticket_id, None)
+        self._dirty.discard(ticket_id)
+        self._scheduled.pop(ticket_id, None)
+
+    def due(self, now: float) -> List[Tuple[str, str]]:
+        """Restituisce [(ticket_id, IDLE_WARN|IDLE_CLOSE)] scaduti e riprogramma gli altri."""
+        actions = []
+        while self._heap and self._heap[0][0] <= now:
+            when, ticket_id = heapq.heappop(self._heap)
+            if self._scheduled.get(ticket_id) != when:
+                continue
+            deadline = self._next_deadline(ticket_id)
+            if deadline > now:
+                # attivita' arrivata dopo la programmazione: si sposta la scadenza
+                self._push(ticket_id, deadline)
+                continue
+            if self._warns() and ticket_id not in self.warned:
+                self.warned[ticket_id] = now
+                self._push(ticket_id, self._next_deadline(ticket_id))
+                actions.append((ticket_id, IDLE_WARN))
+            else:
+                self.forget(ticket_id)
+                actions.append((ticket_id, IDLE_CLOSE))
+        return actions
+
+    def take_dirty(self) -> Dict[str, float]:
+        dirty = {tid: self.last_activity[tid] for tid in self._dirty if tid in self.last_activity}
+        self._dirty.clear()
+        return dirty
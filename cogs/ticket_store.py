@@ -0,0 +1,227 @@
+import json
+import os
+from typing import Optional, Dict, Any, List, Set, Iterator, Tuple
+
+OPEN_STATUS = 'open'
+META_KEY = '_meta'
+
+
+class TicketStore:
+    """Archivio dei ticket con journal JSON e indici secondari.
+
+    Lo stato completo vive in `tickets.json`; ogni modifica viene aggiunta come
+    singola riga al journal (`put`/`del`), quindi una scrittura riguarda un solo
+    record. Al caricamento il journal viene riapplicato sopra lo snapshot e,
+    superate `compact_every` righe, compattato in un nuovo snapshot atomico.
+
+    Le transizioni di stato (`put`/`update`/`delete`) fanno fsync del journal;
+    i campi ad alta frequenza (attivita', avvisi) passano da `update_many`
+    con `sync=False`: una sola write per lotto e nessun fsync sul loop.
+
+    I record restituiti sono copie: per modificarli usare `update`/`put`.
+    I metadati (es. il contatore dei ticket) sono salvati sotto la chiave
+    `_meta` dello snapshot e nel journal come righe `meta`.
+    """
+
+    def __init__(self, path: str, journal_path: Optional[str] = None, compact_every: int = 200):
+        self.path = path
+        self.journal_path = journal_path or os.path.splitext(path)[0] + '.journal'
+        self.compact_every = compact_every
+        self._records: Dict[str, Dict[str, Any]] = {}
+        self._by_author: Dict[str, Set[str]] = {}
+        self._by_status: Dict[str, Set[str]] = {}
+        self._by_panel: Dict[str, Set[str]] = {}
+        self._open_by_author: Dict[str, Set[str]] = {}
+        self._meta: Dict[str, Any] = {}
+        self._journal_lines = 0
+        self._load()
+
+    # ------------------------------
+    # Caricamento / persistenza
+    # ------------------------------
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception:
+            data = {}
+        meta = data.pop(META_KEY, None)
+        if isinstance(meta, dict):
+            self._meta = meta
+        for tid, record in data.items():
+            if isinstance(record, dict):
+                self._set(str(tid), record)
+        replayed = 0
+        try:
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # ultima riga troncata da un crash: ignorata
+                        continue
+                    if entry.get('op') == 'put':
+                        self._set(str(entry['id']), entry['data'])
+                    elif entry.get('op') == 'del':
+                        self._unset(str(entry['id']))
+                    elif entry.get('op') == 'meta':
+                        self._meta.update(entry['data'])
+                    replayed += 1
+        except FileNotFoundError:
+            pass
+        self._journal_lines = replayed
+        if replayed:
+            self.compact()
+
+    def _append(self, entry: Dict[str, Any]):
+        self._append_many([entry])
+
+    def _append_many(self, entries: List[Dict[str, Any]], sync: bool = True):
+        if not entries:
+            return
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            f.write(''.join(json.dumps(entry, ensure_ascii=False) + '\n' for entry in entries))
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+        self._journal_lines += len(entries)
+        if self._journal_lines >= self.compact_every:
+            self.compact()
+
+    def compact(self):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({META_KEY: self._meta, **self._records}, f, indent=2, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        try:
+            os.remove(self.journal_path)
+        except FileNotFoundError:
+            pass
+        self._journal_lines = 0
+
+    # ------------------------------
+    # Indici
+    # ------------------------------
+    @staticmethod
+    def _index_add(index: Dict[str, Set[str]], key, tid: str):
+        if key is None:
+            return
+        index.setdefault(str(key), set()).add(tid)
+
+    @staticmethod
+    def _index_remove(index: Dict[str, Set[str]], key, tid: str):
+        if key is None:
+            return
+        ids = index.get(str(key))
+        if ids is not None:
+            ids.discard(tid)
+            if not ids:
+                del index[str(key)]
+
+    def _set(self, tid: str, record: Dict[str, Any]):
+        self._unset(tid)
+        self._records[tid] = record
+        author, status = record.get('author'), record.get('status')
+        self._index_add(self._by_author, author, tid)
+        self._index_add(self._by_status, status, tid)
+        self._index_add(self._by_panel, record.get('panel'), tid)
+        if status == OPEN_STATUS:
+            self._index_add(self._open_by_author, author, tid)
+
+    def _unset(self, tid: str):
+        old = self._records.pop(tid, None)
+        if old is None:
+            return
+        self._index_remove(self._by_author, old.get('author'), tid)
+        self._index_remove(self._by_status, old.get('status'), tid)
+        self._index_remove(self._by_panel, old.get('panel'), tid)
+        self._index_remove(self._open_by_author, old.get('author'), tid)
+
+    # ------------------------------
+    # API
+    # ------------------------------
+    def __contains__(self, tid) -> bool:
+        return str(tid) in self._records
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __getitem__(self, tid) -> Dict[str, Any]:
+        return dict(self._records[str(tid)])
+
+    def get(self, tid, default=None):
+        record = self._records.get(str(tid))
+        return dict(record) if record is not None else default
+
+    def items(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        for tid, record in list(self._records.items()):
+            yield tid, dict(record)
+
+    def put(self, tid, record: Dict[str, Any]):
+        tid = str(tid)
+        record = dict(record)
+        self._set(tid, record)
+        self._append({'op': 'put', 'id': tid, 'data': record})
+
+    def update(self, tid, **fields) -> Dict[str, Any]:
+        record = dict(self._records[str(tid)])
+        record.update(fields)
+        self.put(tid, record)
+        return dict(record)
+
+    def update_many(self, changes: Dict[Any, Dict[str, Any]], sync: bool = False):
+        """Aggiorna piu' record con una sola scrittura del journal (senza fsync di default)."""
+        entries = []
+        for tid, fields in changes.items():
+            tid = str(tid)
+            if tid not in self._records:
+                continue
+            record = dict(self._records[tid])
+            record.update(fields)
+            self._set(tid, record)
+            entries.append({'op': 'put', 'id': tid, 'data': dict(record)})
+        self._append_many(entries, sync=sync)
+
+    def delete(self, tid):
+        tid = str(tid)
+        if tid not in self._records:
+            return
+        self._unset(tid)
+        self._append({'op': 'del', 'id': tid})
+
+    def next_number(self) -> int:
+        """Incrementa e persiste il contatore dei ticket (mai riutilizzato dopo una delete)."""
+        counter = self._meta.get('counter')
+        if counter is None:
+            numbers = [r.get('number') for r in self._records.values() if isinstance(r.get('number'), int)]
+            counter = max(numbers + [len(self._records)])
+        counter += 1
+        self._meta['counter'] = counter
+        self._append({'op': 'meta', 'data': {'counter': counter}})
+        return counter
+
+    def ids_by_author(self, author_id) -> Set[str]:
+        return set(self._by_author.get(str(author_id), ()))
+
+    def ids_by_status(self, status: str) -> Set[str]:
+        return set(self._by_status.get(status, ()))
+
+    def ids_by_panel(self, panel: str) -> Set[str]:
+        return set(self._by_panel.get(str(panel), ()))
+
+    def open_ids_by_author(self, author_id) -> Set[str]:
+        return set(self._open_by_author.get(str(author_id), ()))
+
+    def open_count(self, author_id) -> int:
+        return len(self._open_by_author.get(str(author_id), ()))
+
+    def by_author(self, author_id, status: Optional[str] = None) -> List[Tuple[str, Dict[str, Any]]]:
+        ids = self.open_ids_by_author(author_id) if status == OPEN_STATUS else self.ids_by_author(author_id)
+        out = []
+        for tid in sorted(ids):
+            record = self._records[tid]
+            if status is None or record.get('status') == status:
+                out.append((tid, dict(record)))
+        return out
@@ -0,0 +1,141 @@
+import asyncio
+import os
+import shutil
+from typing import List, Optional, Tuple
+
+# Numero di messaggi tenuti in memoria prima di scrivere su disco (una pagina di history)
+FLUSH_EVERY = 100
+PREVIEW_CHARS = 1900
+
+
+class TranscriptWriter:
+    """Scrive TXT e HTML di un transcript a blocchi, con le write eseguite in un thread.
+
+    La memoria usata resta limitata a `flush_every` messaggi indipendentemente
+    dalla lunghezza del ticket. Con `resume=(txt_bytes, html_bytes)` i file
+    esistenti vengono riportati a quella lunghezza e si continua in append;
+    se non combaciano si riparte da zero e `resumed` resta False.
+    """
+
+    def __init__(self, txt_path: str, html_path: str, flush_every: int = FLUSH_EVERY, resume: Optional[Tuple[int, int]] = None):
+        self.txt_path: Optional[str] = txt_path
+        self.html_path: Optional[str] = html_path
+        self.flush_every = flush_every
+        self.resume = resume
+        self.resumed = False
+        self.message_count = 0
+        self._txt_buf: List[str] = []
+        self._html_buf: List[str] = []
+        self._txt_file = None
+        self._html_file = None
+
+    async def open(self):
+        await asyncio.to_thread(self._open_files)
+
+    def _open_files(self):
+        mode = 'w'
+        if self.resume is not None:
+            sizes = [os.path.getsize(p) if os.path.exists(p) else -1 for p in (self.txt_path, self.html_path)]
+            if sizes[0] >= self.resume[0] and sizes[1] >= self.resume[1]:
+                mode = 'a'
+                self.resumed = True
+        try:
+            self._txt_file = open(self.txt_path, mode, encoding='utf-8')
+            if self.resumed:
+                self._txt_file.truncate(self.resume[0])
+        except Exception:
+            self.txt_path = None
+        try:
+            self._html_file = open(self.html_path, mode, encoding='utf-8')
+            if self.resumed:
+                self._html_file.truncate(self.resume[1])
+        except Exception:
+            self.html_path = None
+
+    def sizes(self) -> Tuple[int, int]:
+        return (
+            os.path.getsize(self.txt_path) if self.txt_path else 0,
+            os.path.getsize(self.html_path) if self.html_path else 0,
+        )
+
+    def txt(self, line: str):
+        self._txt_buf.append(line)
+
+    def html(self, fragment: str):
+        self._html_buf.append(fragment)
+
+    async def message_done(self):
+        self.message_count += 1
+        if self.message_count % self.flush_every == 0:
+            await self.flush()
+
+    async def flush(self):
+        txt_buf, self._txt_buf = self._txt_buf, []
+        html_buf, self._html_buf = self._html_buf, []
+        if txt_buf or html_buf:
+            await asyncio.to_thread(self._write, txt_buf, html_buf)
+
+    def _write(self, txt_buf: List[str], html_buf: List[str]):
+        if self._txt_file and txt_buf:
+            try:
+                self._txt_file.write('\n'.join(txt_buf) + '\n')
+            except Exception:
+                self._txt_file = None
+                self.txt_path = None
+        if self._html_file and html_buf:
+            try:
+                self._html_file.write('\n'.join(html_buf) + '\n')
+            except Exception:
+                self._html_file = None
+                self.html_path = None
+
+    async def close(self):
+        await self.flush()
+        await asyncio.to_thread(self._close_files)
+
+    def _close_files(self):
+        for f in (self._txt_file, self._html_file):
+            if f is not None:
+                try:
+                    f.close()
+                except Exception:
+                    pass
+        self._txt_file = self._html_file = None
+
+
+def compose_transcript(out_path: str, header: str, body_path: Optional[str], footer: str, preview_chars: int = 0) -> str:
+    """Unisce header + corpo parziale + footer nel file finale copiando a blocchi.
+
+    Va eseguita in un thread; restituisce i primi `preview_chars` caratteri.
+    """
+    with open(out_path, 'w', encoding='utf-8') as out:
+        out.write(header)
+        if body_path and os.path.exists(body_path):
+            with open(body_path, 'r', encoding='utf-8') as body:
+                shutil.copyfileobj(body, out, 64 * 1024)
+        out.write(footer)
+    if not preview_chars:
+        return ''
+    with open(out_path, 'r', encoding='utf-8') as f:
+        return f.read(preview_chars)
+
+
+def render_message(writer: TranscriptWriter, msg, template, attachment_links=None):
+    """Accoda TXT e HTML di un singolo messaggio al writer (HTML da `TranscriptTemplate`).
+
+    `attachment_links` ({attachment.id: link relativo}) sono gli allegati archiviati.
+    """
+    ts = msg.created_at.strftime("%d %b %Y • %H:%M:%S")
+    content_text = msg.content or ""
+    if content_text.strip():
+        writer.txt(f"[{ts}] {msg.author} ({msg.author.id}): {content_text}")
+    else:
+        writer.txt(f"[{ts}] {msg.author} ({msg.author.id}): <Nessun testo>")
+    for att in msg.attachments:
+        try:
+            link = attachment_links.get(att.id) if attachment_links else None
+            archived = f" (archivio: {link})" if link else ""
+            writer.txt(f"    [ALLEGATO] {att.filename} -> {att.url}{archived}")
+        except Exception:
+            pass
+    writer.html(template.message_html(msg, ts, attachment_links))
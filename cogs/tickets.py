@@ -1,17 +1,32 @@
 # cogs/tickets.py
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord import app_commands, ui
 import json
+import io
 import os
-import html as htmlescape
+import asyncio
+import contextlib
+import time
 from datetime import datetime
 from typing import Optional
+from .ticket_transcript import TranscriptWriter, render_message, compose_transcript, PREVIEW_CHARS, FLUSH_EVERY
+from .transcript_attachments import AttachmentFetcher
+from .transcript_archive import TranscriptArchive
+from .transcript_template import TranscriptTemplate, MentionResolver
+from .ticket_store import TicketStore
+from .ticket_idle import IdleTracker, IDLE_WARN, IDLE_CLOSE
 
 BASE_DIR = os.path.dirname(__file__)
 TICKETS_FILE = os.path.join(BASE_DIR, '..', 'tickets.json')
+TICKETS_JOURNAL = os.path.join(BASE_DIR, '..', 'tickets.journal')
+TICKET_CATEGORY_NAME = "Tickets"
+# Limite di Discord sui canali per categoria
+CATEGORY_CHANNEL_LIMIT = 50
 CONFIG_FILE = os.path.join(BASE_DIR, '..', 'config.json')
 TRANSCRIPTS_DIR = os.path.join(os.path.dirname(BASE_DIR), "transcripts")
+PARTIAL_TRANSCRIPTS_DIR = os.path.join(TRANSCRIPTS_DIR, "partial")
+TRANSCRIPT_ARCHIVE_DIR = os.path.join(TRANSCRIPTS_DIR, "archive")
 
 # ---------- CONFIG ----------
 STAFF_ROLES = {
@@ -38,9 +53,39 @@ THEME = {
 def ensure_transcripts_dir():
     try:
         os.makedirs(TRANSCRIPTS_DIR, exist_ok=True)
+        os.makedirs(PARTIAL_TRANSCRIPTS_DIR, exist_ok=True)
     except Exception:
         pass
 
+def partial_transcript_paths(channel_id):
+    """Percorsi del transcript parziale (solo messaggi) usato per gli aggiornamenti incrementali."""
+    return (
+        os.path.join(PARTIAL_TRANSCRIPTS_DIR, f"{channel_id}.txt"),
+        os.path.join(PARTIAL_TRANSCRIPTS_DIR, f"{channel_id}.html"),
+    )
+
+def remove_files(paths):
+    for path in paths:
+        if not path:
+            continue
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def read_files(files):
+    """[(percorso, filename)] -> [(filename, contenuto)], saltando i file mancanti."""
+    out = []
+    for path, filename in files:
+        if not path:
+            continue
+        try:
+            with open(path, 'rb') as f:
+                out.append((filename, f.read()))
+        except OSError:
+            pass
+    return out
+
 def load_json(path, default):
     try:
         with open(path, 'r', encoding='utf-8') as f:
@@ -144,42 +189,12 @@ class TicketPanelButton(ui.Button):
             await interaction.followup.send("Errore: comando non eseguibile qui.", ephemeral=True)
             return
 
-        category = discord.utils.get(guild.categories, name="Tickets")
-        if category is None:
-            try:
-                category = await guild.create_category("Tickets")
-            except Exception as e:
-                await interaction.followup.send(f"❌ Errore nella creazione della categoria: {e}", ephemeral=True)
-                return
-
-        overwrites = {
-            guild.default_role: discord.PermissionOverwrite(read_messages=False),
-            interaction.user: discord.PermissionOverwrite(read_messages=True, send_messages=True),
-            guild.me: discord.PermissionOverwrite(read_messages=True, send_messages=True)
-        }
-
-        staff_role_id = self.cog.config.get("staff_role_id")
-        if staff_role_id:
-            staff_role = guild.get_role(staff_role_id)
-            if staff_role:
-                overwrites[staff_role] = discord.PermissionOverwrite(read_messages=True, send_messages=True)
-
-        channel_name = f"ticket-{interaction.user.name.lower()}-{len(self.cog.tickets) + 1}"
-        try:
-            ticket_channel = await category.create_text_channel(channel_name, overwrites=overwrites)
-        except Exception as e:
-            await interaction.followup.send(f"❌ Errore nella creazione del canale ticket: {e}", ephemeral=True)
+        ticket_channel, error = await self.cog.open_ticket_channel(guild, interaction.user, {'panel': self.panel.get('name')})
+        if ticket_channel is None:
+            await interaction.followup.send(error, ephemeral=True)
             return
 
         ticket_id = str(ticket_channel.id)
-        self.cog.tickets[ticket_id] = {
-            'author': interaction.user.id,
-            'panel': self.panel.get('name'),
-            'created_at': datetime.utcnow().isoformat(),
-            'members': [interaction.user.id],
-            'status': 'open'
-        }
-        self.cog.save_tickets()
 
         embed = discord.Embed(
             title=f"🎟️ Ticket: {self.panel.get('name')}",
@@ -218,7 +233,15 @@ class Tickets(commands.Cog):
     """Cog che gestisce il sistema tickets (slash + comandi classici)"""
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.tickets = load_json(TICKETS_FILE, {})
+        self.tickets = TicketStore(TICKETS_FILE, TICKETS_JOURNAL)
+        # Una coda (lock FIFO) per guild: le creazioni vengono servite in ordine
+        self._creation_locks = {}
+        # channel_id -> lock: un solo transcript alla volta per ticket (bottone, delete, inattivita')
+        self._transcript_locks = {}
+        # guild_id -> [id categorie ticket] ("Tickets", "Tickets 2", ...)
+        self._ticket_categories = {}
+        # guild_id -> overwrite comuni (everyone, bot, staff) gia' costruite
+        self._overwrite_templates = {}
         self.config = load_json(CONFIG_FILE, {})
 
         self.ticket_group = app_commands.Group(name="ticket", description="Gestione tickets")
@@ -227,15 +250,259 @@ class Tickets(commands.Cog):
         self.ticket_group.command(name="close", description="Chiude il ticket nel canale attuale")(self.close_ticket)
         self.ticket_group.command(name="reopen", description="Riapri un ticket chiuso (solo staff)")(self.reopen_ticket)
         self.ticket_group.command(name="delete", description="Elimina definitivamente il ticket (solo staff)")(self.delete_ticket)
+        self.ticket_group.command(name="transcript", description="Reinvia un transcript archiviato (solo staff)")(self.archived_transcript)
         try:
             self.bot.tree.add_command(self.ticket_group)
         except Exception:
             pass
 
         ensure_transcripts_dir()
+        retention = self.config.get('transcript_retention', {})
+        self.transcript_archive = TranscriptArchive(
+            TRANSCRIPT_ARCHIVE_DIR,
+            keep_versions=int(retention.get('keep_versions', 10)),
+            max_age_days=int(retention.get('max_age_days', 365))
+        )
+
+        # Inattivita': ultima attivita' in memoria, scadenze in un unico heap
+        inactivity = self.config.get('ticket_inactivity', {})
+        self.idle = IdleTracker(
+            warn_after=float(inactivity.get('warn_after_hours', 0)) * 3600,
+            close_after=float(inactivity.get('close_after_hours', 0)) * 3600
+        )
+        if self.idle.enabled:
+            # ticket senza attivita' registrata (aperti prima di questa funzione): si parte da adesso,
+            # altrimenti al primo avvio verrebbero avvisati e chiusi tutti insieme
+            now = time.time()
+            seeded = {}
+            for tid in self.tickets.ids_by_status('open'):
+                ticket = self.tickets[tid]
+                last = ticket.get('last_activity')
+                if last is None:
+                    last = now
+                    seeded[tid] = {'last_activity': now}
+                self.idle.track(tid, last, ticket.get('idle_warned_at'))
+            if seeded:
+                self.tickets.update_many(seeded, sync=True)
+            self.idle_sweeper.start()
+            self.activity_flush.start()
+        self.archive_retention.start()
 
     def save_tickets(self):
-        save_json(TICKETS_FILE, self.tickets)
+        """Compatta il journal in tickets.json (le singole modifiche sono gia' persistite)."""
+        try:
+            self.tickets.compact()
+        except Exception:
+            pass
+
+    def cog_unload(self):
+        for loop in (self.idle_sweeper, self.activity_flush, self.archive_retention):
+            try:
+                loop.cancel()
+            except Exception:
+                pass
+        self.persist_activity()
+        self.save_tickets()
+
+    # ---------- Inattivita' ----------
+    def persist_activity(self):
+        """Scrive (in modo lazy) l'ultima attivita' dei ticket toccati da on_message."""
+        changes = {tid: {'last_activity': ts, 'idle_warned_at': None} for tid, ts in self.idle.take_dirty().items()}
+        try:
+            self.tickets.update_many(changes)
+        except Exception:
+            pass
+
+    @commands.Cog.listener()
+    async def on_message(self, message: discord.Message):
+        if message.author.bot or message.guild is None:
+            return
+        self.idle.touch(str(message.channel.id), time.time())
+
+    @tasks.loop(minutes=5)
+    async def activity_flush(self):
+        self.persist_activity()
+
+    @tasks.loop(minutes=1)
+    async def idle_sweeper(self):
+        for tid, action in self.idle.due(time.time()):
+            channel = self.bot.get_channel(int(tid))
+            if channel is None or self.tickets.get(tid, {}).get('status') != 'open':
+                self.idle.forget(tid)
+                continue
+            try:
+                if action == IDLE_WARN:
+                    await self._send_idle_warning(channel, tid)
+                elif action == IDLE_CLOSE:
+                    await self.auto_close_ticket(channel)
+            except Exception:
+                pass
+
+    @tasks.loop(hours=24)
+    async def archive_retention(self):
+        """Applica `transcript_retention` anche ai ticket che non generano nuovi transcript."""
+        try:
+            await asyncio.to_thread(self.transcript_archive.apply_retention)
+        except Exception:
+            pass
+
+    @idle_sweeper.before_loop
+    async def before_idle_sweeper(self):
+        await self.bot.wait_until_ready()
+
+    async def _send_idle_warning(self, channel, ticket_id: str):
+        self.tickets.update_many({ticket_id: {'idle_warned_at': self.idle.warned.get(ticket_id)}})
+        hours = (self.idle.close_after - self.idle.warn_after) / 3600
+        embed = discord.Embed(
+            title="⏰ Ticket inattivo",
+            description=f"Nessun messaggio da un po'. Il ticket verrà chiuso automaticamente tra circa {hours:g} ore se non ci sono nuove risposte.",
+            color=0xF1C40F
+        )
+        await channel.send(embed=embed)
+
+    async def auto_close_ticket(self, channel):
+        """Chiude per inattivita' e genera il transcript senza un'interaction."""
+        self._mark_closed(channel)
+        author_member = channel.guild.get_member(self.tickets[str(channel.id)]['author'])
+        if author_member:
+            try:
+                await channel.set_permissions(author_member, read_messages=True, send_messages=False)
+            except Exception:
+                pass
+        embed = discord.Embed(
+            title="🔒 Ticket Chiuso",
+            description="Il ticket è stato chiuso automaticamente per inattività.\nIl canale rimane visibile ma non puoi scrivere nuovi messaggi.",
+            color=0xE74C3C
+        )
+        try:
+            await channel.send(embed=embed)
+        except Exception:
+            pass
+        await self.create_transcript(channel, requested_by=self.bot.user, invoked_by="inattività")
+
+    def _mark_closed(self, channel) -> dict:
+        self.idle.forget(channel.id)
+        return self.tickets.update(channel.id, status='closed', idle_warned_at=None)
+
+    def open_ticket_limit_message(self, user_id):
+        """Messaggio d'errore se l'utente ha gia' raggiunto il limite di ticket aperti, altrimenti None."""
+        limit = int(self.config.get('max_open_tickets_per_user', 1) or 0)
+        if not limit:
+            return None
+        if self.bot.is_ready():
+            # canali eliminati a mano (o mentre il bot era offline): il record non conta piu'
+            for tid in self.tickets.open_ids_by_author(user_id):
+                if self.bot.get_channel(int(tid)) is None:
+                    self.idle.forget(tid)
+                    self.tickets.update(tid, status='closed', idle_warned_at=None)
+        if self.tickets.open_count(user_id) >= limit:
+            return f"❌ Hai già {limit} ticket aperti: chiudine uno prima di aprirne un altro."
+        return None
+
+    async def open_ticket_channel(self, guild: discord.Guild, user: discord.Member, fields: dict):
+        """Crea canale + record del ticket serializzando le richieste della stessa guild.
+
+        Il controllo del limite, il numero progressivo e la creazione avvengono
+        sotto lo stesso lock, quindi due click contemporanei non creano due
+        canali e i nomi seguono l'ordine di arrivo. Restituisce (canale, None)
+        oppure (None, messaggio d'errore).
+        """
+        lock = self._creation_locks.setdefault(guild.id, asyncio.Lock())
+        async with lock:
+            limit_msg = self.open_ticket_limit_message(user.id)
+            if limit_msg:
+                return None, limit_msg
+
+            try:
+                category = await self._ticket_category(guild)
+            except Exception as e:
+                return None, f"❌ Errore nella creazione della categoria: {e}"
+
+            overwrites = dict(self._overwrite_template(guild))
+            overwrites[user] = discord.PermissionOverwrite(read_messages=True, send_messages=True)
+
+            number = self.tickets.next_number()
+            channel_name = f"ticket-{user.name.lower()}-{number}"
+            try:
+                ticket_channel = await category.create_text_channel(channel_name, overwrites=overwrites)
+            except Exception as e:
+                return None, f"❌ Errore nella creazione del canale ticket: {e}"
+
+            self.tickets.put(ticket_channel.id, {
+                'author': user.id,
+                **fields,
+                'number': number,
+                'created_at': datetime.utcnow().isoformat(),
+                'members': [user.id],
+                'status': 'open'
+            })
+            self.idle.track(ticket_channel.id, time.time())
+            return ticket_channel, None
+
+    def _overwrite_template(self, guild: discord.Guild) -> dict:
+        """Overwrite comuni a tutti i ticket della guild, costruite una sola volta."""
+        template = self._overwrite_templates.get(guild.id)
+        if template is None:
+            template = {
+                guild.default_role: discord.PermissionOverwrite(read_messages=False),
+                guild.me: discord.PermissionOverwrite(read_messages=True, send_messages=True)
+            }
+            staff_role_id = self.config.get("staff_role_id")
+            if staff_role_id:
+                staff_role = guild.get_role(staff_role_id)
+                if staff_role:
+                    template[staff_role] = discord.PermissionOverwrite(read_messages=True, send_messages=True)
+            self._overwrite_templates[guild.id] = template
+        return template
+
+    async def _ticket_category(self, guild: discord.Guild) -> discord.CategoryChannel:
+        """Categoria ticket con posti liberi; crea "Tickets 2", "Tickets 3"... quando le altre sono piene."""
+        category_ids = self._ticket_categories.get(guild.id)
+        if category_ids is None:
+            # primo uso: unica scansione per nome, poi si lavora per id
+            found = []
+            for cat in guild.categories:
+                if cat.name == TICKET_CATEGORY_NAME:
+                    found.append((1, cat.id))
+                elif cat.name.startswith(TICKET_CATEGORY_NAME + " ") and cat.name[len(TICKET_CATEGORY_NAME) + 1:].isdigit():
+                    found.append((int(cat.name[len(TICKET_CATEGORY_NAME) + 1:]), cat.id))
+            category_ids = self._ticket_categories[guild.id] = [cid for _, cid in sorted(found)]
+
+        for cid in list(category_ids):
+            category = guild.get_channel(cid)
+            if category is None:
+                category_ids.remove(cid)
+                continue
+            if len(category.channels) < CATEGORY_CHANNEL_LIMIT:
+                return category
+
+        used = {guild.get_channel(cid).name for cid in category_ids}
+        index = 1
+        name = TICKET_CATEGORY_NAME
+        while name in used:
+            index += 1
+            name = f"{TICKET_CATEGORY_NAME} {index}"
+        category = await guild.create_category(name)
+        category_ids.append(category.id)
+        return category
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel):
+        category_ids = self._ticket_categories.get(channel.guild.id)
+        if category_ids and channel.id in category_ids:
+            category_ids.remove(channel.id)
+        # canale ticket eliminato senza /ticket delete: il record viene chiuso
+        if self.tickets.get(channel.id, {}).get('status') == 'open':
+            try:
+                self._mark_closed(channel)
+            except Exception:
+                pass
+        self._transcript_locks.pop(channel.id, None)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role):
+        if role.id == self.config.get("staff_role_id"):
+            self._overwrite_templates.pop(role.guild.id, None)
 
     def save_config(self):
         save_json(CONFIG_FILE, self.config)
@@ -266,104 +533,85 @@ class Tickets(commands.Cog):
                 pass
             return
 
-        ticket = self.tickets[channel_id]
-        author_id = ticket.get('author')
+        warnings = await self.create_transcript(channel, interaction.user, invoked_by)
+        for warning in warnings:
+            try:
+                await interaction.followup.send(warning, ephemeral=True)
+            except Exception:
+                pass
 
-        # Prepare text and HTML
-        txt_lines = []
-        txt_lines.append(f"===== TRANSCRIPT TICKET {channel.name} =====")
-        txt_lines.append(f"Server: {channel.guild.name} ({channel.guild.id})")
-        creator = channel.guild.get_member(author_id)
-        txt_lines.append(f"Creato da: {creator} ({author_id})")
-        txt_lines.append(f"Aperto il: {ticket.get('created_at')}")
-        txt_lines.append(f"Generato da: {interaction.user} (modo: {invoked_by})")
-        txt_lines.append("")
-        txt_lines.append("----- MESSAGGI -----")
-
-        # HTML header / style (dark theme)
-        html_parts = []
-        html_parts.append("<!doctype html><html lang='it'><head><meta charset='utf-8'><meta name='viewport' content='width=device-width,initial-scale=1'>")
-        html_parts.append(f"<title>Transcript {htmlescape.escape(channel.name)}</title>")
-        html_parts.append("<style>")
-        html_parts.append(f"body{{background:{THEME['background']};color:{THEME['text']};font-family:Segoe UI,Arial,Helvetica,sans-serif;padding:18px}}")
-        html_parts.append(".wrap{max-width:980px;margin:0 auto}")
-        html_parts.append(f".header{{background:{THEME['card']};padding:16px;border-radius:10px;box-shadow:0 2px 8px rgba(0,0,0,0.5);margin-bottom:14px}}")
-        html_parts.append(f".server{{color:{THEME['muted']};font-size:13px}}")
-        html_parts.append(f".title{{font-size:18px;color:{THEME['text']};margin-bottom:6px}}")
-        html_parts.append(".msg{background:#111214;border-radius:8px;padding:10px;margin:10px 0;border:1px solid rgba(255,255,255,0.02)}")
-        html_parts.append(".meta{font-size:12px;color:#9aa3b2;margin-bottom:6px}")
-        html_parts.append(".content{white-space:pre-wrap;color:#d5dbe5}")
-        html_parts.append(f".embed{{border-left:4px solid {THEME['embed_border']};background:#101214;padding:8px;margin-top:6px;border-radius:6px}}")
-        html_parts.append(".attach{font-size:13px;margin-top:6px;color:#9aa3b2}")
-        html_parts.append("</style></head><body><div class='wrap'>")
-        # logo textual (server name)
-        html_parts.append("<div class='header'>")
-        html_parts.append(f"<div class='title'>📄 Transcript — {htmlescape.escape(channel.guild.name)}</div>")
-        html_parts.append(f"<div class='server'>Canale: {htmlescape.escape(channel.name)} • Server ID: {channel.guild.id}</div>")
-        html_parts.append(f"<div class='server'>Creato da: {htmlescape.escape(str(creator))} ({author_id})</div>")
-        html_parts.append(f"<div class='server'>Aperto il: {htmlescape.escape(str(ticket.get('created_at')))}</div>")
-        html_parts.append(f"<div class='server'>Generato da: {htmlescape.escape(str(interaction.user))} (modo: {htmlescape.escape(invoked_by)})</div>")
-        html_parts.append("</div>")
-
-        # iterate history
         try:
-            async for msg in channel.history(limit=None, oldest_first=True):
-                ts = msg.created_at.strftime("%d %b %Y • %H:%M:%S")
-                author_display = f"{htmlescape.escape(str(msg.author))} ({msg.author.id})"
-                content_text = msg.content or ""
-                if content_text.strip():
-                    txt_lines.append(f"[{ts}] {msg.author} ({msg.author.id}): {content_text}")
-                else:
-                    txt_lines.append(f"[{ts}] {msg.author} ({msg.author.id}): <Nessun testo>")
+            await interaction.followup.send("📄 Transcript generato e archiviato in /transcripts/archive/ (inviato a log + DM se possibile).", ephemeral=True)
+        except Exception:
+            pass
 
-                # HTML message
-                html_parts.append("<div class='msg'>")
-                html_parts.append(f"<div class='meta'><strong>{author_display}</strong> • <span>{ts}</span></div>")
-                if content_text.strip():
-                    html_parts.append(f"<div class='content'>{htmlescape.escape(content_text)}</div>")
-                else:
-                    html_parts.append("<div class='content'><i>&lt;Nessun testo&gt;</i></div>")
-
-                # embeds (summarize)
-                if msg.embeds:
-                    for emb in msg.embeds:
-                        try:
-                            html_parts.append("<div class='embed'>")
-                            if getattr(emb, "title", None):
-                                html_parts.append(f"<div><strong>{htmlescape.escape(emb.title)}</strong></div>")
-                            if getattr(emb, "description", None) and emb.description:
-                                html_parts.append(f"<div>{htmlescape.escape((emb.description or '')[:3000])}</div>")
-                            if getattr(emb, "fields", None):
-                                for field in emb.fields:
-                                    html_parts.append(f"<div><em>{htmlescape.escape(field.name)}</em>: {htmlescape.escape(field.value)}</div>")
-                            if getattr(emb, "footer", None) and emb.footer.text:
-                                html_parts.append(f"<div class='meta'>Footer: {htmlescape.escape(emb.footer.text)}</div>")
-                            html_parts.append("</div>")
-                        except Exception:
-                            html_parts.append("<div class='embed'><em>Embed: errore nel parsing</em></div>")
-
-                # attachments
-                if msg.attachments:
-                    for att in msg.attachments:
-                        try:
-                            txt_lines.append(f"    [ALLEGATO] {att.filename} -> {att.url}")
-                            html_parts.append(f"<div class='attach'>📎 <a href='{htmlescape.escape(att.url)}' target='_blank'>{htmlescape.escape(att.filename)}</a></div>")
-                        except Exception:
-                            html_parts.append("<div class='attach'>📎 <em>Allegato (errore)</em></div>")
-
-                html_parts.append("</div>")  # end msg
-        except Exception as e:
-            txt_lines.append(f"[ERRORE LETTURA MESSAGGI: {e}]")
-            html_parts.append(f"<div class='msg'><em>Errore lettura messaggi: {htmlescape.escape(str(e))}</em></div>")
+    async def create_transcript(self, channel: discord.TextChannel, requested_by, invoked_by: str = "unknown"):
+        """
+        Scrive il transcript su disco in streaming (memoria limitata, write fuori dal loop)
+        e lo invia a log + DM. Restituisce gli avvisi da mostrare a chi l'ha richiesto.
 
-        html_parts.append("</div></body></html>")
+        I messaggi gia' archiviati restano in un transcript parziale per ticket
+        (`transcript_cursor` nel ticket): le richieste successive scaricano solo
+        `history(after=cursor)` e li aggiungono in coda. Le richieste sullo
+        stesso ticket vengono serializzate, cosi' parziale e cursore restano coerenti.
+        """
+        lock = self._transcript_locks.setdefault(channel.id, asyncio.Lock())
+        async with lock:
+            return await self._write_transcript(channel, requested_by, invoked_by)
 
-        transcript_text = "\n".join(txt_lines)
-        transcript_html = "\n".join(html_parts)
+    async def _write_transcript(self, channel, requested_by, invoked_by: str):
+        ticket = self.tickets[str(channel.id)]
+        author_id = ticket.get('author')
 
         # Ensure transcripts dir exists
         ensure_transcripts_dir()
 
+        partial_txt, partial_html = partial_transcript_paths(channel.id)
+        cursor = ticket.get('transcript_cursor') or {}
+        resume = (cursor.get('txt_bytes', 0), cursor.get('html_bytes', 0)) if cursor.get('message_id') else None
+        writer = TranscriptWriter(partial_txt, partial_html, resume=resume)
+        template = TranscriptTemplate(THEME, MentionResolver(channel.guild))
+        await writer.open()
+
+        after = discord.Object(id=int(cursor['message_id'])) if writer.resumed else None
+        last_id = cursor.get('message_id') if writer.resumed else None
+        error = None
+        # se il parziale riparte da zero anche allegati archiviati e budget ripartono da zero
+        known_attachments = dict(ticket.get('transcript_attachments') or {}) if writer.resumed else {}
+        fetcher = self._attachment_fetcher(int(ticket.get('attachments_bytes', 0)) if writer.resumed else 0, known_attachments)
+        async with contextlib.AsyncExitStack() as stack:
+            if fetcher is not None:
+                await stack.enter_async_context(fetcher)
+            # pagine da FLUSH_EVERY messaggi: gli allegati di una pagina si scaricano in parallelo
+            batch = []
+            try:
+                async for msg in channel.history(limit=None, oldest_first=True, after=after):
+                    batch.append(msg)
+                    if len(batch) >= FLUSH_EVERY:
+                        last_id = await self._render_transcript_batch(writer, template, batch, fetcher)
+                        batch = []
+            except Exception as e:
+                error = e
+            if batch:
+                last_id = await self._render_transcript_batch(writer, template, batch, fetcher)
+        await writer.close()
+
+        if last_id and writer.txt_path and writer.html_path:
+            try:
+                txt_bytes, html_bytes = writer.sizes()
+                self.tickets.update(channel.id, transcript_cursor={'message_id': last_id, 'txt_bytes': txt_bytes, 'html_bytes': html_bytes})
+            except Exception:
+                pass
+        attachments = fetcher.stored if fetcher is not None else known_attachments
+        if fetcher is not None or attachments != (ticket.get('transcript_attachments') or {}):
+            self.tickets.update(channel.id, attachments_bytes=fetcher.used_bytes if fetcher is not None else 0, transcript_attachments=attachments)
+
+        creator = channel.guild.get_member(author_id)
+        txt_header = self._transcript_header(channel, ticket, creator, requested_by, invoked_by)
+        html_header = template.header(channel, ticket, creator, requested_by, invoked_by)
+        txt_footer = f"[ERRORE LETTURA MESSAGGI: {error}]\n" if error else ""
+        html_footer = template.footer(error)
+
         safe_name = channel.name.replace(" ", "_")
         timestamp_str = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
         txt_filename = f"transcript_{safe_name}_{channel.id}_{timestamp_str}.txt"
@@ -371,18 +619,97 @@ class Tickets(commands.Cog):
         txt_path = os.path.join(TRANSCRIPTS_DIR, txt_filename)
         html_path = os.path.join(TRANSCRIPTS_DIR, html_filename)
 
+        preview = ''
         try:
-            with open(txt_path, 'w', encoding='utf-8') as f:
-                f.write(transcript_text)
+            preview = await asyncio.to_thread(compose_transcript, txt_path, txt_header, writer.txt_path, txt_footer, PREVIEW_CHARS)
         except Exception:
             txt_path = None
-
         try:
-            with open(html_path, 'w', encoding='utf-8') as f:
-                f.write(transcript_html)
+            await asyncio.to_thread(compose_transcript, html_path, html_header, writer.html_path, html_footer)
         except Exception:
             html_path = None
 
+        # letti una volta sola: log e DM ricevono gli stessi buffer in memoria
+        payloads = await asyncio.to_thread(read_files, [(html_path, html_filename), (txt_path, txt_filename)])
+        # i file in chiaro servivano solo per l'invio; in archivio finiscono header/corpo/footer
+        await asyncio.to_thread(remove_files, [txt_path, html_path])
+
+        warnings = []
+        # Archivia header/corpo/footer separati (gzip + dedup per hash): il corpo e' il parziale,
+        # quindi transcript dello stesso ticket con header diversi condividono lo stesso oggetto
+        try:
+            await asyncio.to_thread(self.transcript_archive.store, channel.id, [
+                ('txt', txt_filename, txt_header, writer.txt_path, txt_footer),
+                ('html', html_filename, html_header, writer.html_path, html_footer),
+            ], attachments)
+        except Exception:
+            warnings.append("⚠️ Errore durante l'archiviazione del transcript.")
+        finally:
+            if fetcher is not None:
+                await asyncio.to_thread(self.transcript_archive.release, fetcher.pinned)
+
+        # zip con HTML + attachments/: i link relativi del transcript funzionano una volta estratto
+        html_data = next((data for filename, data in payloads if filename == html_filename), None)
+        if attachments and html_data is not None:
+            try:
+                bundled = await asyncio.to_thread(self.transcript_archive.bundle, html_filename, html_data, attachments)
+                if bundled:
+                    payloads.append(bundled)
+            except Exception:
+                warnings.append("⚠️ Impossibile preparare lo zip degli allegati.")
+
+        warnings = await self._deliver_transcript(channel, author_id, payloads, preview, requested_by, invoked_by) + warnings
+
+        if fetcher is not None and fetcher.skipped:
+            warnings.append(f"⚠️ {fetcher.skipped} allegati non archiviati (limite di dimensione o errore di download).")
+        return warnings
+
+    def _attachment_fetcher(self, used_bytes: int, known: dict) -> Optional[AttachmentFetcher]:
+        settings = self.config.get('transcript_attachments', {})
+        if not settings.get('enabled'):
+            return None
+        return AttachmentFetcher(
+            self.transcript_archive.put_blob,
+            max_concurrency=int(settings.get('max_concurrency', 4)),
+            max_bytes=int(float(settings.get('max_mb_per_ticket', 0)) * 1024 * 1024),
+            max_file_bytes=int(float(settings.get('max_kb_per_file', 1024)) * 1024),
+            used_bytes=used_bytes,
+            known=known
+        )
+
+    async def _render_transcript_batch(self, writer, template, batch, fetcher):
+        """Archivia (se abilitato) gli allegati della pagina e la accoda al writer; restituisce l'ultimo id."""
+        links = None
+        if fetcher is not None:
+            try:
+                links = await fetcher.fetch_many(att for msg in batch for att in msg.attachments)
+            except Exception:
+                links = None
+        for msg in batch:
+            render_message(writer, msg, template, links)
+            await writer.message_done()
+        return batch[-1].id
+
+    def _transcript_header(self, channel, ticket, creator, requested_by, invoked_by: str):
+        author_id = ticket.get('author')
+        txt_lines = [
+            f"===== TRANSCRIPT TICKET {channel.name} =====",
+            f"Server: {channel.guild.name} ({channel.guild.id})",
+            f"Creato da: {creator} ({author_id})",
+            f"Aperto il: {ticket.get('created_at')}",
+            f"Generato da: {requested_by} (modo: {invoked_by})",
+            "",
+            "----- MESSAGGI -----",
+        ]
+        return "\n".join(txt_lines) + "\n"
+
+    def discard_partial_transcript(self, channel_id):
+        remove_files(partial_transcript_paths(channel_id))
+
+    async def _deliver_transcript(self, channel, author_id, payloads, preview, requested_by, invoked_by):
+        """Invia [(filename, contenuto)] al canale log e in DM all'autore, senza rileggere i file da disco."""
+        warnings = []
+
         # Send to log channel
         log_channel = None
         try:
@@ -396,55 +723,43 @@ class Tickets(commands.Cog):
             except Exception:
                 log_channel = None
 
-        log_msg = f"📄 Transcript del ticket `{channel.name}` (invocato da {interaction.user.mention}, modo: {invoked_by})"
+        requester = getattr(requested_by, 'mention', str(requested_by))
+        log_msg = f"📄 Transcript del ticket `{channel.name}` (invocato da {requester}, modo: {invoked_by})"
+
+        def build_files():
+            # un discord.File viene consumato dall'upload: ogni destinazione ha il suo BytesIO sugli stessi byte
+            return [discord.File(io.BytesIO(data), filename=filename) for filename, data in payloads]
 
         if log_channel:
             try:
-                files = []
-                if html_path:
-                    files.append(discord.File(html_path, filename=html_filename))
-                if txt_path:
-                    files.append(discord.File(txt_path, filename=txt_filename))
+                files = build_files()
                 if files:
                     await log_channel.send(content=log_msg, files=files)
                 else:
-                    await log_channel.send(content=log_msg + "\n```" + (transcript_text[:1900] or "Nessun contenuto") + "```")
+                    await log_channel.send(content=log_msg + "\n```" + (preview or "Nessun contenuto") + "```")
             except Exception:
-                try:
-                    await interaction.followup.send("⚠️ Non sono riuscito a inviare il transcript nel canale log (permessi?).", ephemeral=True)
-                except Exception:
-                    pass
+                warnings.append("⚠️ Non sono riuscito a inviare il transcript nel canale log (permessi?).")
         else:
-            try:
-                await interaction.followup.send("⚠️ Canale di log non trovato; transcript salvato localmente.", ephemeral=True)
-            except Exception:
-                pass
+            warnings.append("⚠️ Canale di log non trovato; transcript salvato solo in archivio.")
 
         # DM to ticket author
         try:
             author_member = channel.guild.get_member(author_id)
             if author_member:
                 try:
-                    files = []
-                    if html_path:
-                        files.append(discord.File(html_path, filename=html_filename))
-                    if txt_path:
-                        files.append(discord.File(txt_path, filename=txt_filename))
+                    header = f"📄 Transcript del tuo ticket `{channel.name}` (richiesto da {requested_by}):"
+                    # file allegati e non link alla CDN del canale log: quegli URL sono firmati e scadono
+                    files = build_files()
                     if files:
-                        await author_member.send(content=f"📄 Transcript del tuo ticket `{channel.name}` (richiesto da {interaction.user}):", files=files)
+                        await author_member.send(content=header, files=files)
                     else:
-                        await author_member.send(content=f"📄 Transcript del tuo ticket `{channel.name}` (richiesto da {interaction.user}):\n```{transcript_text[:1900]}```")
+                        await author_member.send(content=f"{header}\n```{preview}```")
                 except Exception:
                     pass
         except Exception:
             pass
 
-        try:
-            await interaction.followup.send("📄 Transcript generato e salvato in /transcripts/ (inviato a log + DM se possibile).", ephemeral=True)
-        except Exception:
-            pass
-
-        # Do NOT delete the files: keep them for archive as requested
+        return warnings
 
     # ---------- Slash commands (app commands) ----------
     async def ticket_panel(self, interaction: discord.Interaction):
@@ -481,42 +796,12 @@ class Tickets(commands.Cog):
             await interaction.followup.send("Errore: comando non eseguibile qui.", ephemeral=True)
             return
 
-        category = discord.utils.get(guild.categories, name="Tickets")
-        if category is None:
-            try:
-                category = await guild.create_category("Tickets")
-            except Exception as e:
-                await interaction.followup.send(f"❌ Errore nella creazione della categoria: {e}", ephemeral=True)
-                return
-
-        channel_name = f"ticket-{interaction.user.name.lower()}-{len(self.tickets) + 1}"
-        overwrites = {
-            guild.default_role: discord.PermissionOverwrite(read_messages=False),
-            interaction.user: discord.PermissionOverwrite(read_messages=True, send_messages=True),
-            guild.me: discord.PermissionOverwrite(read_messages=True, send_messages=True)
-        }
-
-        staff_role_id = self.config.get("staff_role_id")
-        if staff_role_id:
-            staff_role = guild.get_role(staff_role_id)
-            if staff_role:
-                overwrites[staff_role] = discord.PermissionOverwrite(read_messages=True, send_messages=True)
-
-        try:
-            ticket_channel = await category.create_text_channel(channel_name, overwrites=overwrites)
-        except Exception as e:
-            await interaction.followup.send(f"❌ Errore nella creazione del canale ticket: {e}", ephemeral=True)
+        ticket_channel, error = await self.open_ticket_channel(guild, interaction.user, {'topic': topic})
+        if ticket_channel is None:
+            await interaction.followup.send(error, ephemeral=True)
             return
 
         ticket_id = str(ticket_channel.id)
-        self.tickets[ticket_id] = {
-            'author': interaction.user.id,
-            'topic': topic,
-            'created_at': datetime.utcnow().isoformat(),
-            'members': [interaction.user.id],
-            'status': 'open'
-        }
-        self.save_tickets()
 
         embed = discord.Embed(
             title=f"🎟️ Ticket: {topic}",
@@ -557,8 +842,7 @@ class Tickets(commands.Cog):
             await interaction.followup.send("❌ Solo l'autore, lo staff o un admin può chiudere questo ticket!", ephemeral=True)
             return
 
-        ticket['status'] = 'closed'
-        self.save_tickets()
+        ticket = self._mark_closed(interaction.channel)
 
         author_member = interaction.guild.get_member(ticket['author'])
         if author_member:
@@ -609,8 +893,8 @@ class Tickets(commands.Cog):
             await interaction.followup.send("❌ Questo ticket non è chiuso!", ephemeral=True)
             return
 
-        ticket['status'] = 'open'
-        self.save_tickets()
+        ticket = self.tickets.update(channel_id, status='open', last_activity=time.time(), idle_warned_at=None)
+        self.idle.track(channel_id, ticket['last_activity'])
 
         author = interaction.guild.get_member(ticket['author'])
         if author:
@@ -673,10 +957,12 @@ class Tickets(commands.Cog):
 
         # remove stored ticket
         try:
-            del self.tickets[channel_id]
-            self.save_tickets()
+            self.tickets.delete(channel_id)
+            self.idle.forget(channel_id)
         except Exception:
             pass
+        self.discard_partial_transcript(channel_id)
+        self._transcript_locks.pop(channel.id, None)
 
         # delete the channel
         try:
@@ -693,6 +979,48 @@ class Tickets(commands.Cog):
         except Exception:
             pass
 
+    @app_commands.describe(ticket_id="ID del canale ticket (vuoto = canale attuale)", versione="Numero della versione (vuoto = ultima)")
+    async def archived_transcript(self, interaction: discord.Interaction, ticket_id: Optional[str] = None, versione: Optional[int] = None):
+        """/ticket transcript"""
+        await interaction.response.defer(ephemeral=True)
+        staff_role_id = self.config.get("staff_role_id")
+        is_staff = False
+        if staff_role_id:
+            staff_role = interaction.guild.get_role(staff_role_id)
+            is_staff = staff_role in interaction.user.roles if staff_role else False
+
+        if not is_staff and not interaction.user.guild_permissions.administrator:
+            await interaction.followup.send("❌ Solo lo staff o un admin può recuperare i transcript!", ephemeral=True)
+            return
+
+        ticket_id = (ticket_id or str(interaction.channel_id)).strip()
+        versions = await asyncio.to_thread(self.transcript_archive.versions, ticket_id)
+        if not versions:
+            await interaction.followup.send("❌ Nessun transcript archiviato per questo ticket.", ephemeral=True)
+            return
+        if versione is not None and not 1 <= versione <= len(versions):
+            await interaction.followup.send(f"❌ Versione non valida: disponibili 1-{len(versions)}.", ephemeral=True)
+            return
+
+        index = versione - 1 if versione is not None else len(versions) - 1
+        try:
+            files = await asyncio.to_thread(self.transcript_archive.load, ticket_id, index)
+        except Exception:
+            files = None
+        if not files:
+            await interaction.followup.send("❌ Impossibile leggere il transcript dall'archivio.", ephemeral=True)
+            return
+
+        created_at = versions[index].get('created_at', '')[:19].replace('T', ' ')
+        try:
+            await interaction.followup.send(
+                f"📄 Transcript del ticket `{ticket_id}`, versione {index + 1}/{len(versions)} ({created_at} UTC)",
+                files=[discord.File(io.BytesIO(data), filename=filename) for filename, data in files],
+                ephemeral=True
+            )
+        except Exception as e:
+            await interaction.followup.send(f"❌ Invio del transcript non riuscito: {e}", ephemeral=True)
+
     # ---------- Classic (text) commands for ticket management ----------
     @commands.command(name="add_member")
     @commands.has_permissions(manage_channels=True)
@@ -711,8 +1039,7 @@ class Tickets(commands.Cog):
             await ctx.send("❌ Questo utente è già nel ticket!")
             return
 
-        ticket.setdefault('members', []).append(member.id)
-        self.save_tickets()
+        self.tickets.update(channel_id, members=ticket.get('members', []) + [member.id])
         await ctx.channel.set_permissions(member, read_messages=True, send_messages=True)
         await ctx.send(f"✅ {member.mention} è stato aggiunto al ticket.")
 
@@ -733,14 +1060,13 @@ class Tickets(commands.Cog):
             await ctx.send("❌ Questo utente non è nel ticket!")
             return
 
-        ticket['members'].remove(member.id)
-        self.save_tickets()
+        self.tickets.update(channel_id, members=[m for m in ticket['members'] if m != member.id])
         await ctx.channel.set_permissions(member, overwrite=None)
         await ctx.send(f"✅ {member.mention} è stato rimosso dal ticket.")
 
     @commands.command(name="list_tickets")
     async def list_tickets(self, ctx: commands.Context):
-        user_tickets = [(tid, t) for tid, t in self.tickets.items() if t.get('author') == ctx.author.id and t.get('status') == 'open']
+        user_tickets = self.tickets.by_author(ctx.author.id, status='open')
         if not user_tickets:
             await ctx.send("❌ Non hai ticket aperti!")
             return
@@ -762,6 +1088,7 @@ class Tickets(commands.Cog):
         embed.add_field(name="/ticket list", value="Mostra tutti i tuoi ticket aperti", inline=False)
         embed.add_field(name="/ticket panel", value="Mostra il pannello per creare ticket", inline=False)
         embed.add_field(name="/ticket reopen", value="Riapri un ticket chiuso (solo staff)", inline=False)
+        embed.add_field(name="/ticket transcript [ticket_id] [versione]", value="Reinvia un transcript archiviato (solo staff)", inline=False)
         await ctx.send(embed=embed)
 
     @commands.command(name="add_staff_role")
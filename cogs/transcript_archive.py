@@ -0,0 +1,256 @@
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+import threading
+import zipfile
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, List, Tuple
+
+from .transcript_attachments import ATTACHMENTS_PREFIX
+
+INDEX_FILE = 'index.json'
+
+
+class TranscriptArchive:
+    """Archivio compresso e content-addressed dei transcript.
+
+    Ogni transcript e' salvato come sequenza di parti (header, corpo dei
+    messaggi, footer), ognuna come `objects/<sha256>.gz` scritto una sola
+    volta. L'header cambia a ogni invocazione (chi l'ha richiesto, modo), il
+    corpo no: il transcript del bottone e quello della delete dello stesso
+    ticket condividono l'oggetto del corpo e aggiungono solo un header. Gli
+    allegati scaricati sono oggetti dello stesso tipo, elencati nella versione
+    come {nome: sha256}: lo stesso file in piu' versioni o ticket occupa
+    spazio una volta sola.
+    L'indice (`index.json`) associa ticket -> versioni -> parti. Gli oggetti
+    in scrittura o in lettura restano in `_pending` finche' l'operazione non
+    finisce, cosi' la pulizia della retention non li cancella a meta'. Tutti
+    i metodi fanno I/O su disco e vanno chiamati con asyncio.to_thread.
+    """
+
+    def __init__(self, directory: str, keep_versions: int = 10, max_age_days: int = 365):
+        self.directory = directory
+        self.objects_dir = os.path.join(directory, 'objects')
+        self.keep_versions = keep_versions
+        self.max_age_days = max_age_days
+        self._lock = threading.Lock()
+        self._pending: Counter = Counter()
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self._index: Dict[str, List[Dict[str, Any]]] = self._load_index()
+
+    # ------------------------------
+    # Indice
+    # ------------------------------
+    def _load_index(self) -> Dict[str, List[Dict[str, Any]]]:
+        try:
+            with open(os.path.join(self.directory, INDEX_FILE), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception:
+            return {}
+
+    def _save_index(self):
+        path = os.path.join(self.directory, INDEX_FILE)
+        tmp = path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self._index, f, indent=2, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    # ------------------------------
+    # Oggetti
+    # ------------------------------
+    def _object_path(self, digest: str) -> str:
+        return os.path.join(self.objects_dir, f'{digest}.gz')
+
+    def _pin(self, digest: str):
+        with self._lock:
+            self._pending[digest] += 1
+
+    def _unpin(self, digests: List[str]):
+        with self._lock:
+            self._pending.subtract(digests)
+            for digest in set(digests):
+                if self._pending[digest] <= 0:
+                    self._pending.pop(digest, None)
+
+    @staticmethod
+    def _hash_file(path: str) -> Tuple[str, int]:
+        h = hashlib.sha256()
+        size = 0
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(64 * 1024), b''):
+                h.update(chunk)
+                size += len(chunk)
+        return h.hexdigest(), size
+
+    # _put_file/_put_bytes lasciano l'oggetto in _pending: lo sblocca chi lo ha scritto
+    def _put_file(self, path: str) -> Tuple[str, int]:
+        digest, size = self._hash_file(path)
+        self._pin(digest)
+        try:
+            dst = self._object_path(digest)
+            if not os.path.exists(dst):
+                tmp = f'{dst}.{threading.get_ident()}.tmp'
+                with open(path, 'rb') as fin, gzip.open(tmp, 'wb') as fout:
+                    shutil.copyfileobj(fin, fout, 64 * 1024)
+                os.replace(tmp, dst)
+        except Exception:
+            self._unpin([digest])
+            raise
+        return digest, size
+
+    def _put_bytes(self, data: bytes) -> Tuple[str, int]:
+        digest = hashlib.sha256(data).hexdigest()
+        self._pin(digest)
+        try:
+            dst = self._object_path(digest)
+            if not os.path.exists(dst):
+                tmp = f'{dst}.{threading.get_ident()}.tmp'
+                with gzip.open(tmp, 'wb') as fout:
+                    fout.write(data)
+                os.replace(tmp, dst)
+        except Exception:
+            self._unpin([digest])
+            raise
+        return digest, len(data)
+
+    # ------------------------------
+    # Allegati
+    # ------------------------------
+    def put_blob(self, data: bytes) -> str:
+        """Salva un allegato; resta protetto dalla pulizia finche' non viene passato a release()."""
+        return self._put_bytes(data)[0]
+
+    def release(self, digests: List[str]):
+        self._unpin(digests)
+
+    def bundle(self, html_filename: str, html_data: bytes, attachments: Dict[str, str]) -> Optional[Tuple[str, bytes]]:
+        """Zip con l'HTML e la cartella attachments/, dove i link relativi del transcript funzionano."""
+        if not attachments:
+            return None
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, 'w', zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr(html_filename, html_data)
+            for name, digest in sorted(attachments.items()):
+                try:
+                    with gzip.open(self._object_path(digest), 'rb') as fin:
+                        zf.writestr(ATTACHMENTS_PREFIX + name, fin.read())
+                except OSError:
+                    continue
+        return os.path.splitext(html_filename)[0] + '.zip', buf.getvalue()
+
+    # ------------------------------
+    # Versioni
+    # ------------------------------
+    def store(self, ticket_id, files: List[Tuple[str, str, str, Optional[str], str]],
+              attachments: Optional[Dict[str, str]] = None) -> Optional[Dict[str, Any]]:
+        """Archivia [(tipo, filename, header, percorso corpo, footer)] come nuova versione del ticket.
+
+        Il corpo e' il transcript parziale (solo messaggi) e non viene
+        modificato; `attachments` ({nome: sha256}) sono gli allegati gia'
+        salvati con put_blob. Se parti e allegati coincidono con l'ultima
+        versione non viene creata una nuova voce.
+        """
+        attachments = dict(attachments or {})
+        entries = {}
+        pinned = []
+        try:
+            for kind, filename, header, body_path, footer in files:
+                if not body_path or not os.path.exists(body_path):
+                    continue
+                parts = []
+                size = 0
+                for put, source in (
+                    (self._put_bytes, header.encode('utf-8')),
+                    (self._put_file, body_path),
+                    (self._put_bytes, footer.encode('utf-8')),
+                ):
+                    digest, part_size = put(source)
+                    pinned.append(digest)
+                    parts.append(digest)
+                    size += part_size
+                entries[kind] = {'filename': filename, 'parts': parts, 'size': size}
+            if not entries:
+                return None
+            with self._lock:
+                versions = self._index.setdefault(str(ticket_id), [])
+                latest = versions[-1] if versions else None
+                if (latest and latest.get('attachments', {}) == attachments
+                        and {k: v['parts'] for k, v in latest['files'].items()} == {k: v['parts'] for k, v in entries.items()}):
+                    return latest
+                version = {'created_at': datetime.utcnow().isoformat(), 'files': entries}
+                if attachments:
+                    version['attachments'] = attachments
+                versions.append(version)
+                self._apply_retention_locked()
+                self._save_index()
+                return version
+        finally:
+            self._unpin(pinned)
+
+    def versions(self, ticket_id) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._index.get(str(ticket_id), []))
+
+    def load(self, ticket_id, version: int = -1) -> Optional[List[Tuple[str, bytes]]]:
+        """Ricompone i file di una versione (indice nella lista, -1 = ultima) come [(filename, contenuto)].
+
+        Se la versione ha allegati si aggiunge lo zip di bundle().
+        """
+        with self._lock:
+            versions = self._index.get(str(ticket_id), [])
+            try:
+                files = versions[version]['files']
+                attachments = versions[version].get('attachments', {})
+            except IndexError:
+                return None
+            pinned = [digest for f in files.values() for digest in f['parts']] + list(attachments.values())
+            self._pending.update(pinned)
+        try:
+            out = []
+            for kind, f in files.items():
+                data = bytearray()
+                for digest in f['parts']:
+                    with gzip.open(self._object_path(digest), 'rb') as fin:
+                        data += fin.read()
+                out.append((f['filename'], bytes(data)))
+                if kind == 'html':
+                    bundled = self.bundle(f['filename'], bytes(data), attachments)
+                    if bundled:
+                        out.append(bundled)
+            return out
+        finally:
+            self._unpin(pinned)
+
+    def apply_retention(self):
+        with self._lock:
+            self._apply_retention_locked()
+            self._save_index()
+
+    def _apply_retention_locked(self):
+        cutoff = (datetime.utcnow() - timedelta(days=self.max_age_days)).isoformat() if self.max_age_days else None
+        for ticket_id in list(self._index):
+            versions = self._index[ticket_id]
+            if cutoff:
+                versions = [v for v in versions if v.get('created_at', '') >= cutoff]
+            if self.keep_versions:
+                versions = versions[-self.keep_versions:]
+            if versions:
+                self._index[ticket_id] = versions
+            else:
+                del self._index[ticket_id]
+        referenced = set()
+        for versions in self._index.values():
+            for v in versions:
+                for f in v['files'].values():
+                    referenced.update(f['parts'])
+                referenced.update(v.get('attachments', {}).values())
+        for name in os.listdir(self.objects_dir):
+            if name.endswith('.gz') and name[:-3] not in referenced and name[:-3] not in self._pending:
+                try:
+                    os.remove(os.path.join(self.objects_dir, name))
+                except OSError:
+                    pass
@@ -0,0 +1,103 @@
+import asyncio
+import re
+from typing import Callable, Dict, Iterable, List, Optional
+
+import aiohttp
+
+CHUNK_SIZE = 64 * 1024
+ATTACHMENTS_PREFIX = 'attachments/'
+_UNSAFE_CHARS = re.compile(r'[^A-Za-z0-9._-]+')
+
+
+def attachment_name(digest: str, filename: str) -> str:
+    """Nome dell'allegato nel pacchetto: prefisso dell'hash + nome originale ripulito."""
+    safe = _UNSAFE_CHARS.sub('_', filename or 'file').strip('._') or 'file'
+    return f"{digest[:16]}_{safe[-80:]}"
+
+
+class AttachmentFetcher:
+    """Scarica gli allegati dei messaggi e li salva nell'archivio dei transcript.
+
+    I download condividono una sessione aiohttp e un semaforo
+    (`max_concurrency`); ogni file viene letto a blocchi in memoria, al
+    massimo `max_file_bytes`, e passato a `store(data) -> sha256` in un
+    thread: l'archivio lo comprime e lo salva una sola volta per contenuto.
+    L'HTML collega `attachments/<nome>`, che si risolve estraendo lo zip
+    inviato insieme al transcript.
+
+    `known` ({nome: sha256}) sono gli allegati gia' archiviati per il
+    transcript parziale; `stored` li contiene tutti, compresi i nuovi. Un
+    contenuto gia' presente non consuma di nuovo il budget `max_bytes`
+    (0 = nessun limite), che parte da `used_bytes`. Gli hash restituiti da
+    `store` sono in `pinned` finche' la versione non entra nell'indice.
+    """
+
+    def __init__(self, store: Callable[[bytes], str], max_concurrency: int = 4, max_bytes: int = 0,
+                 max_file_bytes: int = 1024 * 1024, used_bytes: int = 0, known: Optional[Dict[str, str]] = None):
+        self.store = store
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self.used_bytes = used_bytes
+        self.stored: Dict[str, str] = dict(known or {})
+        self.pinned: List[str] = []
+        self.skipped = 0
+        self._semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._timeout = aiohttp.ClientTimeout(total=60, sock_read=20)
+
+    async def __aenter__(self):
+        self._session = aiohttp.ClientSession(timeout=self._timeout)
+        return self
+
+    async def __aexit__(self, *exc):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _reserve(self, size: int) -> bool:
+        if self.max_bytes and self.used_bytes + size > self.max_bytes:
+            return False
+        self.used_bytes += size
+        return True
+
+    async def fetch_many(self, attachments: Iterable) -> Dict[int, str]:
+        """Archivia gli allegati e restituisce {attachment.id: link relativo}."""
+        attachments = list(attachments)
+        if not attachments:
+            return {}
+        results = await asyncio.gather(*(self._fetch(att) for att in attachments))
+        return {att.id: ATTACHMENTS_PREFIX + name for att, name in zip(attachments, results) if name}
+
+    async def _fetch(self, att) -> Optional[str]:
+        size = int(getattr(att, 'size', 0) or 0)
+        if size > self.max_file_bytes or not self._reserve(size):
+            self.skipped += 1
+            return None
+        async with self._semaphore:
+            try:
+                data = await self._download(att.url)
+                digest = await asyncio.to_thread(self.store, data)
+            except Exception:
+                self.used_bytes -= size
+                self.skipped += 1
+                return None
+        self.pinned.append(digest)
+        name = attachment_name(digest, att.filename)
+        if name in self.stored:
+            # stesso contenuto gia' archiviato per questo ticket: non occupa altro spazio
+            self.used_bytes -= size
+        else:
+            # la dimensione dichiarata da Discord fa fede per il limite; si corregge col valore reale
+            self.used_bytes += len(data) - size
+            self.stored[name] = digest
+        return name
+
+    async def _download(self, url: str) -> bytes:
+        data = bytearray()
+        async with self._session.get(url) as response:
+            response.raise_for_status()
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                data += chunk
+                if len(data) > self.max_file_bytes:
+                    raise ValueError("allegato oltre il limite")
+        return bytes(data)
@@ -0,0 +1,230 @@
+import html as htmlescape
+import re
+from string import Template
+from typing import Optional, Dict, Any, Callable
+
+# ------------------------------
+# Markdown Discord
+# ------------------------------
+_CODE_BLOCK = re.compile(r"```(?:([\w+-]+)\n)?(.*?)```", re.S)
+_INLINE_CODE = re.compile(r"`([^`\n]+)`")
+# Le regex lavorano su testo gia' escapato: '<' e '>' sono '&lt;' e '&gt;'
+_USER_MENTION = re.compile(r"&lt;@!?(\d+)&gt;")
+_ROLE_MENTION = re.compile(r"&lt;@&amp;(\d+)&gt;")
+_CHANNEL_MENTION = re.compile(r"&lt;#(\d+)&gt;")
+_CUSTOM_EMOJI = re.compile(r"&lt;(a?):(\w{2,32}):(\d+)&gt;")
+# (carattere marcatore, regex, sostituzione): la regex gira solo se il marcatore e' presente
+_INLINE_RULES = (
+    ('**', re.compile(r"\*\*(.+?)\*\*", re.S), r"<strong>\1</strong>"),
+    ('__', re.compile(r"__(.+?)__", re.S), r"<u>\1</u>"),
+    ('*', re.compile(r"(?<![\w*])\*(?!\s)(.+?)(?<!\s)\*(?![\w*])", re.S), r"<em>\1</em>"),
+    ('_', re.compile(r"(?<![\w_])_(?!\s)(.+?)(?<!\s)_(?![\w_])", re.S), r"<em>\1</em>"),
+    ('~~', re.compile(r"~~(.+?)~~", re.S), r"<s>\1</s>"),
+    ('||', re.compile(r"\|\|(.+?)\|\|", re.S), r"<span class='spoiler'>\1</span>"),
+)
+_QUOTE_LINE = re.compile(r"^&gt; ?(.*)$", re.M)
+
+STYLE_TEMPLATE = Template(
+    "body{background:$background;color:$text;font-family:Segoe UI,Arial,Helvetica,sans-serif;padding:18px}\n"
+    ".wrap{max-width:980px;margin:0 auto}\n"
+    ".header{background:$card;padding:16px;border-radius:10px;box-shadow:0 2px 8px rgba(0,0,0,0.5);margin-bottom:14px}\n"
+    ".server{color:$muted;font-size:13px}\n"
+    ".title{font-size:18px;color:$text;margin-bottom:6px}\n"
+    ".msg{background:#111214;border-radius:8px;padding:10px;margin:10px 0;border:1px solid rgba(255,255,255,0.02)}\n"
+    ".meta{font-size:12px;color:#9aa3b2;margin-bottom:6px}\n"
+    ".content{white-space:pre-wrap;color:#d5dbe5}\n"
+    ".embed{border-left:4px solid $embed_border;background:#101214;padding:8px;margin-top:6px;border-radius:6px}\n"
+    ".attach{font-size:13px;margin-top:6px;color:#9aa3b2}\n"
+    ".attach img{display:block;max-width:100%;max-height:480px;margin-top:4px;border-radius:4px}\n"
+    ".mention{background:rgba(114,137,218,0.25);color:$accent;border-radius:3px;padding:0 2px}\n"
+    ".emoji{width:1.375em;height:1.375em;vertical-align:bottom}\n"
+    ".spoiler{background:#202225;color:transparent;border-radius:3px}.spoiler:hover{color:inherit}\n"
+    "code{background:#2b2d31;border-radius:3px;padding:0 3px;font-family:Consolas,monospace}\n"
+    "pre{background:#2b2d31;border-radius:4px;padding:8px;white-space:pre-wrap}\n"
+    "blockquote{border-left:4px solid $embed_border;margin:0;padding-left:8px}"
+)
+
+HEADER_TEMPLATE = Template(
+    "<!doctype html><html lang='it'><head><meta charset='utf-8'><meta name='viewport' content='width=device-width,initial-scale=1'>\n"
+    "<title>Transcript $channel</title>\n"
+    "<style>\n$style\n</style></head><body><div class='wrap'>\n"
+    "<div class='header'>\n"
+    "<div class='title'>📄 Transcript — $guild</div>\n"
+    "<div class='server'>Canale: $channel • Server ID: $guild_id</div>\n"
+    "<div class='server'>Creato da: $creator ($author_id)</div>\n"
+    "<div class='server'>Aperto il: $created_at</div>\n"
+    "<div class='server'>Generato da: $requested_by (modo: $invoked_by)</div>\n"
+    "</div>\n"
+)
+
+FOOTER = "</div></body></html>"
+
+
+class MentionResolver:
+    """Risolve (con cache) i nomi di utenti, ruoli e canali menzionati nei messaggi."""
+
+    def __init__(self, guild=None):
+        self.guild = guild
+        self._cache: Dict[tuple, Optional[str]] = {}
+
+    def _lookup(self, kind: str, obj_id: int, getter: Callable[[int], Any], attr: str) -> Optional[str]:
+        key = (kind, obj_id)
+        if key not in self._cache:
+            name = None
+            try:
+                obj = getter(obj_id) if self.guild is not None else None
+                if obj is not None:
+                    name = getattr(obj, attr, None) or str(obj)
+            except Exception:
+                name = None
+            self._cache[key] = name
+        return self._cache[key]
+
+    def user(self, user_id: int) -> Optional[str]:
+        return self._lookup('user', user_id, lambda i: self.guild.get_member(i), 'display_name')
+
+    def role(self, role_id: int) -> Optional[str]:
+        return self._lookup('role', role_id, lambda i: self.guild.get_role(i), 'name')
+
+    def channel(self, channel_id: int) -> Optional[str]:
+        return self._lookup('channel', channel_id, lambda i: self.guild.get_channel(i), 'name')
+
+
+class TranscriptTemplate:
+    """Template HTML dei transcript: stile compilato una volta, un frammento per messaggio.
+
+    `message_html(msg)` restituisce l'intero blocco del messaggio come unica
+    stringa, con markdown Discord, menzioni e emoji custom gia' convertiti.
+    """
+
+    _style_cache: Dict[tuple, str] = {}
+
+    def __init__(self, theme: Dict[str, str], resolver: Optional[MentionResolver] = None):
+        key = tuple(sorted(theme.items()))
+        style = self._style_cache.get(key)
+        if style is None:
+            style = self._style_cache[key] = STYLE_TEMPLATE.safe_substitute(theme)
+        self.style = style
+        self.resolver = resolver or MentionResolver()
+        self._mention_subs = (
+            (_ROLE_MENTION, lambda m: self._mention('@', self.resolver.role(int(m.group(1))), m.group(1))),
+            (_USER_MENTION, lambda m: self._mention('@', self.resolver.user(int(m.group(1))), m.group(1))),
+            (_CHANNEL_MENTION, lambda m: self._mention('#', self.resolver.channel(int(m.group(1))), m.group(1))),
+            (_CUSTOM_EMOJI, self._emoji),
+        )
+
+    # ------------------------------
+    # Header / footer
+    # ------------------------------
+    def header(self, channel, ticket: Dict[str, Any], creator, requested_by, invoked_by: str) -> str:
+        esc = htmlescape.escape
+        return HEADER_TEMPLATE.substitute(
+            style=self.style,
+            channel=esc(channel.name),
+            guild=esc(channel.guild.name),
+            guild_id=channel.guild.id,
+            creator=esc(str(creator)),
+            author_id=ticket.get('author'),
+            created_at=esc(str(ticket.get('created_at'))),
+            requested_by=esc(str(requested_by)),
+            invoked_by=esc(invoked_by),
+        )
+
+    @staticmethod
+    def footer(error=None) -> str:
+        if error:
+            return f"<div class='msg'><em>Errore lettura messaggi: {htmlescape.escape(str(error))}</em></div>\n{FOOTER}"
+        return FOOTER
+
+    # ------------------------------
+    # Markdown
+    # ------------------------------
+    @staticmethod
+    def _mention(prefix: str, name: Optional[str], raw_id: str) -> str:
+        label = htmlescape.escape(name) if name else raw_id
+        return f"<span class='mention'>{prefix}{label}</span>"
+
+    @staticmethod
+    def _emoji(m) -> str:
+        ext = 'gif' if m.group(1) else 'png'
+        return f"<img class='emoji' alt=':{m.group(2)}:' title=':{m.group(2)}:' src='https://cdn.discordapp.com/emojis/{m.group(3)}.{ext}'>"
+
+    def _inline(self, text: str) -> str:
+        """Testo senza blocchi di codice: escape, codice inline, menzioni, emoji e stili."""
+        text = htmlescape.escape(text, quote=False)
+        parts = _INLINE_CODE.split(text) if '`' in text else (text,)
+        out = []
+        for i, part in enumerate(parts):
+            if i % 2:
+                out.append(f"<code>{part}</code>")
+                continue
+            if '&lt;' in part:
+                for pattern, repl in self._mention_subs:
+                    part = pattern.sub(repl, part)
+            for marker, pattern, repl in _INLINE_RULES:
+                if marker in part:
+                    part = pattern.sub(repl, part)
+            if '&gt;' in part:
+                part = _QUOTE_LINE.sub(r"<blockquote>\1</blockquote>", part)
+            out.append(part)
+        return ''.join(out)
+
+    def markdown(self, text: str) -> str:
+        if '```' not in text:
+            return self._inline(text)
+        out = []
+        pos = 0
+        for m in _CODE_BLOCK.finditer(text):
+            out.append(self._inline(text[pos:m.start()]))
+            out.append(f"<pre><code>{htmlescape.escape(m.group(2), quote=False)}</code></pre>")
+            pos = m.end()
+        out.append(self._inline(text[pos:]))
+        return ''.join(out)
+
+    # ------------------------------
+    # Messaggi
+    # ------------------------------
+    def message_html(self, msg, timestamp: str, attachment_links: Optional[Dict[int, str]] = None) -> str:
+        esc = htmlescape.escape
+        parts = [
+            "<div class='msg'><div class='meta'><strong>", esc(str(msg.author)), " (", str(msg.author.id),
+            ")</strong> • <span>", timestamp, "</span></div>",
+        ]
+        content_text = msg.content or ""
+        if content_text.strip():
+            parts += ("<div class='content'>", self.markdown(content_text), "</div>")
+        else:
+            parts.append("<div class='content'><i>&lt;Nessun testo&gt;</i></div>")
+
+        for emb in msg.embeds:
+            try:
+                emb_parts = ["<div class='embed'>"]
+                if getattr(emb, "title", None):
+                    emb_parts.append(f"<div><strong>{esc(emb.title)}</strong></div>")
+                if getattr(emb, "description", None):
+                    emb_parts.append(f"<div>{self.markdown(emb.description[:3000])}</div>")
+                for field in getattr(emb, "fields", None) or ():
+                    emb_parts.append(f"<div><em>{esc(field.name)}</em>: {self.markdown(field.value)}</div>")
+                if getattr(emb, "footer", None) and emb.footer.text:
+                    emb_parts.append(f"<div class='meta'>Footer: {esc(emb.footer.text)}</div>")
+                emb_parts.append("</div>")
+                parts += emb_parts
+            except Exception:
+                parts.append("<div class='embed'><em>Embed: errore nel parsing</em></div>")
+
+        for att in msg.attachments:
+            try:
+                link = attachment_links.get(att.id) if attachment_links else None
+                if link:
+                    # copia archiviata (cartella attachments/ dello zip) + URL originale della CDN
+                    html = f"<div class='attach'>📎 <a href='{esc(link)}' target='_blank'>{esc(att.filename)}</a> (<a href='{esc(att.url)}' target='_blank'>originale</a>)"
+                    if (getattr(att, 'content_type', None) or '').startswith('image/'):
+                        html += f"<img src='{esc(link)}' alt='{esc(att.filename)}' onerror=\"this.onerror=null;this.src='{esc(att.url)}'\">"
+                    parts.append(html + "</div>")
+                else:
+                    parts.append(f"<div class='attach'>📎 <a href='{esc(att.url)}' target='_blank'>{esc(att.filename)}</a></div>")
+            except Exception:
+                parts.append("<div class='attach'>📎 <em>Allegato (errore)</em></div>")
+
+        parts.append("</div>")
+        return ''.join(parts)
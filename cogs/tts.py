@@ -1,18 +1,26 @@
 import asyncio
-import io
+import math
 import os
-import json
 import random
+import re
 import logging
 from collections import deque
-from typing import List
+from typing import Dict, List, Optional
 
-import requests
 import discord
 from discord.ext import commands, tasks
 from discord import app_commands, ui
 from dotenv import load_dotenv
 
+from bot_utils import owner_or_has_permissions
+
+from .elevenlabs_client import ElevenLabsClient, ElevenLabsError, STREAM_CHUNK_SIZE
+from .tts_admission import TTSAdmission, ADMIT, REJECT_DUPLICATE, REJECT_USER_RATE, estimate_seconds
+from .tts_audio import AudioStream, CachedClip, encode_opus
+from .tts_cache import AudioCache, cache_key
+from .tts_settings import TTSSettings
+from .tts_voices import VoiceCatalog
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("tts")
 
@@ -21,50 +29,323 @@ ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
 
 BASE_DIR = os.path.dirname(__file__)
 TTS_JSON = os.path.join(BASE_DIR, "tts.json")
+TTS_USERS_JSON = os.path.join(BASE_DIR, "tts_users.json")
+TTS_CACHE_DIR = os.path.join(os.path.dirname(BASE_DIR), "tts_cache")
+VOICES_FILE = os.path.join(TTS_CACHE_DIR, "voices.json")
+
+MAX_QUEUE_PER_GUILD = 10
+# Durata stimata massima dell'audio in coda (o in generazione) per guild
+MAX_QUEUED_SECONDS_PER_GUILD = 180
+IDLE_DISCONNECT_SECONDS = 120
+# Testi lunghi: pezzi da al massimo CHUNK_MAX_CHARS, sintetizzati al massimo MAX_CONCURRENT_SYNTH alla volta
+CHUNK_MAX_CHARS = 250
+MAX_CONCURRENT_SYNTH = 3
+
+DEFAULT_TTS_CONFIG = {
+    "preset": "maschio",
+    "presets": {
+        "maschio": "Luca",
+        "femmina": "Sofia"
+    },
+    "profiles": {
+        "narratore": {"stability": 0.7, "similarity_boost": 0.9},
+        "robotico": {"stability": 1.0, "similarity_boost": 0.2},
+        "profondo": {"stability": 0.9, "similarity_boost": 0.7},
+        "giovane": {"stability": 0.8, "similarity_boost": 0.95}
+    }
+}
+
+_SENTENCE_END = re.compile(r"(?<=[.!?…;])\s+|\n+")
+
+
+def split_text(text: str, max_chars: int = CHUNK_MAX_CHARS) -> List[str]:
+    """Divide il testo sui confini di frase, unendo le frasi brevi fino a max_chars."""
+    chunks: List[str] = []
+    current = ""
+    for sentence in _SENTENCE_END.split(text.strip()):
+        sentence = sentence.strip()
+        if not sentence:
+            continue
+        # frase troppo lunga: si spezza sugli spazi
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(" ", 0, max_chars)
+            cut = cut if cut > 0 else max_chars
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.append(sentence[:cut].strip())
+            sentence = sentence[cut:].strip()
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            chunks.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        chunks.append(current)
+    return chunks
+
+def _close_orphan_stream(task: asyncio.Task):
+    """Chiude lo stream di un pezzo arrivato dopo l'annullamento della richiesta."""
+    if task.cancelled() or task.exception() is not None:
+        return
+    stream = task.result()
+    if stream:
+        stream.close()
+
 
 # -------------------------------------------------------------------
 #  VOICE MANAGER
 # -------------------------------------------------------------------
 class VoiceManager:
+    MODEL_ID = "eleven_multilingual_v2"
+    VOICE_SETTINGS = {
+        "stability": 1,
+        "similarity_boost": 0.8,
+        "style": 0.5,
+        "use_speaker_boost": True
+    }
+
     def __init__(self, api_key: str):
         self.api_key = api_key
-        self.voice_cache = []
-        self.session = requests.Session()
-
-    def fetch_voices(self):
-        url = "https://api.elevenlabs.io/v1/voices"
-        headers = {"xi-api-key": self.api_key}
-        response = self.session.get(url, headers=headers)
-        response.raise_for_status()
-        self.voice_cache = response.json().get("voices", [])
+        self.client = ElevenLabsClient(api_key)
+        self.cache = AudioCache(TTS_CACHE_DIR)
+        self.catalog = VoiceCatalog(VOICES_FILE)
+        self._pumps = set()
+        self._synth_slots = asyncio.Semaphore(MAX_CONCURRENT_SYNTH)
+
+    async def load(self):
+        """Scansione della cache audio e catalogo voci da disco, fuori dal loop."""
+        await asyncio.to_thread(self.cache.load)
+        await asyncio.to_thread(self.catalog.load)
+
+    @property
+    def voice_cache(self):
+        return self.catalog.voices
+
+    async def refresh_voices(self, force: bool = False):
+        """Riscarica il catalogo solo se serve (scaduto, voce mancante) e rispettando il backoff."""
+        if not force and not self.catalog.needs_refresh():
+            return
+        try:
+            voices, etag = await self.client.get_voices(self.catalog.etag)
+        except ElevenLabsError as e:
+            self.catalog.failed()
+            logger.warning(f"Aggiornamento voci fallito: {e}")
+            return
+        self.catalog.update(voices, etag)
+        try:
+            await asyncio.to_thread(self.catalog.save)
+        except Exception as e:
+            logger.warning(f"Salvataggio catalogo voci fallito: {e}")
 
     def find_voice_by_name(self, name: str):
-        return next((v for v in self.voice_cache if v["name"].lower() == name.lower()), None)
-
-    def fetch_audio_stream(self, text: str, voice_id: str):
-        url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}/stream"
-        payload = {
-            "model_id": "eleven_multilingual_v2",
-            "text": text,
-            "voice_settings": {
-                "stability": 1,
-                "similarity_boost": 0.8,
-                "style": 0.5,
-                "use_speaker_boost": True
-            }
-        }
-        headers = {
-            "xi-api-key": self.api_key,
-            "Content-Type": "application/json"
-        }
-
+        voice = self.catalog.get(name)
+        if voice is None:
+            # voce sconosciuta: forse e' stata aggiunta di recente, il loop ricarica (una volta per nome)
+            self.catalog.mark_stale(name)
+        return voice
+
+    async def fetch_audio_stream(self, text: str, voice_id: str):
+        """Restituisce un AudioStream che si riempie in background mentre FFmpeg lo legge.
+
+        Le frasi gia' sintetizzate con la stessa voce/impostazioni arrivano dalla cache.
+        """
+        key = cache_key(voice_id, self.MODEL_ID, self.VOICE_SETTINGS, text)
+        cached = await asyncio.to_thread(self.cache.get, key)
+        if cached is not None:
+            data, fmt = cached
+            if fmt == "opus":
+                return CachedClip(data)
+            stream = AudioStream()
+            stream.feed(data)
+            stream.finish()
+            return stream
+        # lo slot resta occupato finche' il clip non e' scaricato del tutto (rilasciato da _pump)
+        await self._synth_slots.acquire()
         try:
-            r = self.session.post(url, json=payload, headers=headers, stream=True)
-            r.raise_for_status()
-            return io.BytesIO(r.content)
-        except requests.RequestException as e:
+            response = await self.client.open_stream(text, voice_id, self.MODEL_ID, self.VOICE_SETTINGS)
+        except ElevenLabsError as e:
+            self._synth_slots.release()
             logger.error(f"Audio stream error: {e}")
             return None
+        except BaseException:
+            self._synth_slots.release()
+            raise
+        stream = AudioStream()
+        task = asyncio.create_task(self._pump(response, stream, key))
+        self._pumps.add(task)
+        task.add_done_callback(self._pumps.discard)
+        return stream
+
+    async def _pump(self, response, stream: AudioStream, key: str):
+        error = None
+        data = bytearray()
+        try:
+            async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+                stream.feed(chunk)
+                data += chunk
+        except Exception as e:
+            error = e
+            logger.error(f"Audio stream interrotto: {e}")
+        finally:
+            response.release()
+            stream.finish(error)
+            self._synth_slots.release()
+        # solo clip completi finiscono in cache, convertiti una volta in Opus se FFmpeg lo consente
+        if error is None and data:
+            opus = await encode_opus(bytes(data))
+            try:
+                if opus:
+                    await asyncio.to_thread(self.cache.put, key, opus, "opus")
+                else:
+                    await asyncio.to_thread(self.cache.put, key, bytes(data), "mp3")
+            except Exception as e:
+                logger.warning(f"Scrittura cache TTS fallita: {e}")
+
+    async def close(self):
+        for task in list(self._pumps):
+            task.cancel()
+        await self.client.close()
+
+
+# -------------------------------------------------------------------
+#  SESSIONE VOCALE PER GUILD
+# -------------------------------------------------------------------
+class GuildTTSSession:
+    """Coda di riproduzione, voice client e timer di inattivita' di una singola guild.
+
+    Il callback `after` di discord.py gira nel thread audio: il passaggio al
+    clip successivo viene sempre riportato sul loop con call_soon_threadsafe.
+    Le richieste ancora in sintesi prenotano posto con `reserve`, cosi' due
+    /tts say contemporanei non superano insieme i limiti della coda.
+    """
+
+    def __init__(self, guild: discord.Guild, loop: asyncio.AbstractEventLoop,
+                 max_queue: int = MAX_QUEUE_PER_GUILD, idle_timeout: float = IDLE_DISCONNECT_SECONDS,
+                 max_queued_seconds: float = MAX_QUEUED_SECONDS_PER_GUILD):
+        self.guild = guild
+        self.loop = loop
+        self.max_queue = max_queue
+        self.idle_timeout = idle_timeout
+        self.max_queued_seconds = max_queued_seconds
+        self.queue = deque()
+        self.queued_seconds = 0.0
+        self.current_stream = None
+        self.current_seconds = 0.0
+        self._pending_items = 0
+        self._pending_seconds = 0.0
+        self._idle_handle: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def voice_client(self) -> Optional[discord.VoiceClient]:
+        return self.guild.voice_client
+
+    @property
+    def full(self) -> bool:
+        return len(self.queue) >= self.max_queue
+
+    def reserve(self, items: int, seconds: float) -> Optional[str]:
+        """Prenota posto in coda; restituisce None o il motivo del rifiuto ("queue_full" / "queue_time")."""
+        if len(self.queue) + self._pending_items + items > self.max_queue:
+            return "queue_full"
+        busy = self.queued_seconds + self.current_seconds + self._pending_seconds
+        if busy + seconds > self.max_queued_seconds:
+            return "queue_time"
+        self._pending_items += items
+        self._pending_seconds += seconds
+        return None
+
+    def release(self, items: int, seconds: float):
+        self._pending_items = max(0, self._pending_items - items)
+        self._pending_seconds = max(0.0, self._pending_seconds - seconds)
+
+    def enqueue(self, stream, seconds: float = 0.0) -> bool:
+        if self.full:
+            stream.close()
+            return False
+        self.queue.append((stream, seconds))
+        self.queued_seconds += seconds
+        self._cancel_idle()
+        vc = self.voice_client
+        if vc and not vc.is_playing() and not vc.is_paused():
+            self._play_next()
+        return True
+
+    def _after(self, error=None):
+        if error:
+            logger.error(f"Errore riproduzione TTS ({self.guild.id}): {error}")
+        self.loop.call_soon_threadsafe(self._play_next)
+
+    def _play_next(self):
+        vc = self.voice_client
+        if vc is None or not vc.is_connected():
+            self.clear()
+            return
+        if vc.is_playing():
+            return
+        self.current_stream = None
+        self.current_seconds = 0.0
+        if not self.queue:
+            self._schedule_idle()
+            return
+        stream, seconds = self.queue.popleft()
+        self.queued_seconds = max(0.0, self.queued_seconds - seconds)
+        self.current_stream = stream
+        self.current_seconds = seconds
+        try:
+            vc.play(stream.source(), after=self._after)
+        except Exception as e:
+            logger.error(f"Impossibile avviare la riproduzione ({self.guild.id}): {e}")
+            stream.close()
+            self.loop.call_soon(self._play_next)
+
+    def ensure_idle_timer(self):
+        """Avvia il timer di uscita se il bot e' collegato ma non ha niente da riprodurre."""
+        vc = self.voice_client
+        if vc is None or self.queue or vc.is_playing() or vc.is_paused():
+            return
+        if self._idle_handle is None:
+            self._schedule_idle()
+
+    def _schedule_idle(self):
+        self._cancel_idle()
+        self._idle_handle = self.loop.call_later(self.idle_timeout, lambda: asyncio.create_task(self.disconnect()))
+
+    def _cancel_idle(self):
+        if self._idle_handle is not None:
+            self._idle_handle.cancel()
+            self._idle_handle = None
+
+    def close(self):
+        """Chiusura senza voice client (gia' scollegato): svuota coda e timer."""
+        self._cancel_idle()
+        self.clear()
+
+    def clear(self):
+        for stream, _ in self.queue:
+            stream.close()
+        self.queue.clear()
+        self.queued_seconds = 0.0
+        if self.current_stream is not None:
+            self.current_stream.close()
+            self.current_stream = None
+        self.current_seconds = 0.0
+
+    def stop(self):
+        self.clear()
+        vc = self.voice_client
+        if vc and vc.is_playing():
+            vc.stop()
+
+    async def disconnect(self):
+        self._cancel_idle()
+        self.stop()
+        vc = self.voice_client
+        if vc:
+            try:
+                await vc.disconnect()
+            except Exception:
+                pass
 
 
 # -------------------------------------------------------------------
@@ -77,10 +358,7 @@ class VoiceSelect(ui.Select):
 
     async def callback(self, interaction: discord.Interaction):
         cog: "TTSCog" = interaction.client.get_cog("TTSCog")
-        user_id = str(interaction.user.id)
-
-        cog.tts_config["user_voices"][user_id] = self.values[0]
-        cog.save_config()
+        cog.settings.set_user(interaction.user.id, voice=self.values[0])
 
         await interaction.response.send_message(f"✅ Voce personale impostata su **{self.values[0]}**", ephemeral=True)
 
@@ -98,77 +376,56 @@ class TTSCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.voice_manager = VoiceManager(ELEVENLABS_API_KEY)
-        self.audio_queue = deque()
-        self.load_config()
+        self.sessions: Dict[int, GuildTTSSession] = {}
+        self.admission = TTSAdmission()
+        self.settings = TTSSettings(TTS_JSON, TTS_USERS_JSON, DEFAULT_TTS_CONFIG)
 
-        try:
-            self.voice_manager.fetch_voices()
-        except:
-            pass
+    async def cog_load(self):
+        await self.voice_manager.load()
+        await asyncio.to_thread(self.settings.load)
+        # file mancante: scrive i valori predefiniti
+        await self.settings.flush()
 
+        # le voci arrivano subito dalla copia su disco; il loop le aggiorna solo quando serve
         self.update_voice_cache.start()
+        self.prune_admission.start()
 
-    # ------------------------------
-    # Config
-    # ------------------------------
-    def load_config(self):
-        if not os.path.exists(TTS_JSON):
-            default_cfg = {
-                "preset": "maschio",
-                "presets": {
-                    "maschio": "Luca",
-                    "femmina": "Sofia"
-                },
-                "user_voices": {},
-                "profiles": {
-                    "narratore": {"stability": 0.7, "similarity_boost": 0.9},
-                    "robotico": {"stability": 1.0, "similarity_boost": 0.2},
-                    "profondo": {"stability": 0.9, "similarity_boost": 0.7},
-                    "giovane": {"stability": 0.8, "similarity_boost": 0.95}
-                }
-            }
-            with open(TTS_JSON, "w", encoding="utf-8") as f:
-                json.dump(default_cfg, f, indent=2, ensure_ascii=False)
-
-        with open(TTS_JSON, "r", encoding="utf-8") as f:
-            self.tts_config = json.load(f)
-
-    def save_config(self):
-        with open(TTS_JSON, "w", encoding="utf-8") as f:
-            json.dump(self.tts_config, f, indent=2, ensure_ascii=False)
+    async def cog_unload(self):
+        self.update_voice_cache.cancel()
+        self.prune_admission.cancel()
+        await self.settings.close()
+        for session in list(self.sessions.values()):
+            await session.disconnect()
+        self.sessions.clear()
+        await self.voice_manager.close()
 
     @tasks.loop(minutes=2)
     async def update_voice_cache(self):
-        try:
-            self.voice_manager.fetch_voices()
-        except:
-            pass
+        await self.voice_manager.refresh_voices()
+
+    @tasks.loop(minutes=5)
+    async def prune_admission(self):
+        self.admission.prune()
 
     # ------------------------------
     # AUDIO PLAYBACK
     # ------------------------------
-    def play_next_audio(self, interaction: discord.Interaction, error=None):
-        if error:
-            logger.error(error)
-
-        if self.audio_queue:
-            stream = self.audio_queue.popleft()
-            stream.seek(0)
-            source = discord.FFmpegPCMAudio(stream, pipe=True)
-            interaction.guild.voice_client.play(
-                source,
-                after=lambda e: self.play_next_audio(interaction, e)
-            )
-        else:
-            try:
-                asyncio.create_task(interaction.guild.voice_client.disconnect())
-            except:
-                pass
+    def get_session(self, guild: discord.Guild) -> GuildTTSSession:
+        session = self.sessions.get(guild.id)
+        if session is None:
+            session = self.sessions[guild.id] = GuildTTSSession(guild, asyncio.get_running_loop())
+        return session
+
+    @commands.Cog.listener()
+    async def on_voice_state_update(self, member, before, after):
+        # bot scollegato (kick, disconnect manuale o idle): la sessione della guild viene chiusa
+        if member.id == self.bot.user.id and after.channel is None:
+            session = self.sessions.pop(member.guild.id, None)
+            if session is not None:
+                session.close()
 
     async def ensure_voice(self, interaction: discord.Interaction):
-        if not interaction.user.voice:
-            await interaction.response.send_message("❌ Devi essere in un canale vocale.", ephemeral=True)
-            raise commands.CommandError("No VC")
+        """Collega (o sposta) il bot nel canale vocale dell'utente, che deve essere gia' verificato."""
         vc = interaction.guild.voice_client
         channel = interaction.user.voice.channel
         if not vc:
@@ -186,39 +443,108 @@ class TTSCog(commands.Cog):
     # -------------------------------------------------------------------
     @tts.command(name="say", description="Fai parlare il bot.")
     async def say(self, interaction: discord.Interaction, text: str):
-        await self.ensure_voice(interaction)
+        # subito: connessione e sintesi possono superare i 3 secondi concessi per rispondere
+        await interaction.response.defer(ephemeral=True)
 
-        user_id = str(interaction.user.id)
+        if not interaction.user.voice:
+            await interaction.followup.send("❌ Devi essere in un canale vocale.", ephemeral=True)
+            return
 
         # Priorità voce:
         # 1. voce personale
-        if user_id in self.tts_config["user_voices"]:
-            voice_name = self.tts_config["user_voices"][user_id]
+        voice_name = self.settings.user_voice(interaction.user.id)
 
         # 2. preset globale
-        else:
-            preset = self.tts_config.get("preset", "maschio")
-            voice_name = self.tts_config["presets"].get(preset, "Luca")
+        if not voice_name:
+            preset = self.settings.get("preset", "maschio")
+            voice_name = self.settings.get("presets", {}).get(preset, "Luca")
 
         # Cerca voce
         selected = self.voice_manager.find_voice_by_name(voice_name)
 
         if not selected:
+            if not self.voice_manager.voice_cache:
+                await interaction.followup.send("❌ Nessuna voce disponibile al momento.", ephemeral=True)
+                return
             selected = random.choice(self.voice_manager.voice_cache)
 
         voice_id = selected["voice_id"]
 
-        stream = self.voice_manager.fetch_audio_stream(text, voice_id)
-
-        if not stream:
-            await interaction.response.send_message("❌ Errore nella generazione audio.", ephemeral=True)
+        session = self.get_session(interaction.guild)
+        chunks = split_text(text)
+        if not chunks:
+            await interaction.followup.send("❌ Testo vuoto.", ephemeral=True)
+            return
+        durations = [estimate_seconds(chunk) for chunk in chunks]
+        total_seconds = sum(durations)
+
+        # prima la coda (nessun token consumato se e' piena), poi i limiti per utente/guild
+        problem = session.reserve(len(chunks), total_seconds)
+        if problem:
+            self.admission.count(f"rejected_{problem}")
+            await interaction.followup.send("⏳ Coda TTS piena, riprova tra poco.", ephemeral=True)
+            return
+        verdict, wait = self.admission.check(interaction.guild.id, interaction.user.id, text, voice_id, cost=len(chunks))
+        if verdict != ADMIT:
+            session.release(len(chunks), total_seconds)
+            if verdict == REJECT_DUPLICATE:
+                msg = "ℹ️ Questo testo è appena stato richiesto."
+            elif verdict == REJECT_USER_RATE:
+                msg = f"⏳ Stai usando il TTS troppo spesso, riprova tra {math.ceil(wait)}s."
+            else:
+                msg = f"⏳ Troppe richieste TTS in questo server, riprova tra {math.ceil(wait)}s."
+            await interaction.followup.send(msg, ephemeral=True)
             return
 
-        await interaction.response.send_message("🔊 Sto parlando...", ephemeral=True)
+        chunk_tasks = []
+        consumed = 0
+        queued = 0
+        failed = False
+        try:
+            try:
+                await self.ensure_voice(interaction)
+            except Exception as e:
+                logger.error(f"Connessione vocale fallita ({interaction.guild.id}): {e}")
+                await interaction.followup.send("❌ Non riesco a entrare nel canale vocale.", ephemeral=True)
+                return
+
+            # tutti i pezzi partono subito (limitati dal semaforo del VoiceManager) ma entrano
+            # in coda nell'ordine del testo: il primo suona mentre gli altri vengono generati
+            chunk_tasks = [asyncio.create_task(self.voice_manager.fetch_audio_stream(chunk, voice_id)) for chunk in chunks]
+            for task, seconds in zip(chunk_tasks, durations):
+                consumed += 1
+                stream = await task
+                if failed:
+                    if stream:
+                        stream.close()
+                    continue
+                if not stream or not session.enqueue(stream, seconds):
+                    failed = True
+                    continue
+                queued += 1
+        finally:
+            # eccezione o annullamento a meta': i pezzi rimasti vengono annullati o chiusi
+            for task in chunk_tasks[consumed:]:
+                if task.done():
+                    _close_orphan_stream(task)
+                else:
+                    task.cancel()
+                    task.add_done_callback(_close_orphan_stream)
+            session.release(len(chunks), total_seconds)
+            # niente in riproduzione (es. tutti i pezzi falliti): parte il timer di uscita dal canale
+            session.ensure_idle_timer()
+
+        self.admission.count("chunks_queued", queued)
+        if failed:
+            self.admission.count("synth_failed")
+        if not queued:
+            await interaction.followup.send("❌ Errore nella generazione audio.", ephemeral=True)
+            return
+        if failed:
+            await interaction.followup.send("⚠️ Parte del testo non è stata generata.", ephemeral=True)
+            return
 
-        self.audio_queue.append(stream)
-        if not interaction.guild.voice_client.is_playing():
-            self.play_next_audio(interaction)
+        await interaction.followup.send("🔊 Sto parlando...", ephemeral=True)
 
     # -------------------------------------------------------------------
     # PRESET COMMAND
@@ -231,8 +557,7 @@ class TTSCog(commands.Cog):
             await interaction.response.send_message("❌ Opzioni valide: maschio / femmina", ephemeral=True)
             return
 
-        self.tts_config["preset"] = mode
-        self.save_config()
+        self.settings.set("preset", mode)
 
         await interaction.response.send_message(f"✅ Preset impostato su **{mode}**", ephemeral=True)
 
@@ -241,25 +566,28 @@ class TTSCog(commands.Cog):
     # -------------------------------------------------------------------
     @tts.command(name="voice", description="Imposta la tua voce personalizzata")
     async def voice(self, interaction: discord.Interaction, voice: str):
-        user_id = str(interaction.user.id)
-        self.tts_config["user_voices"][user_id] = voice
-        self.save_config()
+        # solo voci del catalogo: un nome libero sbagliato non deve restare salvato
+        selected = self.voice_manager.catalog.get(voice)
+        if not selected:
+            await interaction.response.send_message(f"❌ Voce **{voice}** non trovata. Scegli tra i suggerimenti o usa /tts list.", ephemeral=True)
+            return
 
-        await interaction.response.send_message(f"✅ Voce impostata su **{voice}**", ephemeral=True)
+        self.settings.set_user(interaction.user.id, voice=selected["name"])
+
+        await interaction.response.send_message(f"✅ Voce impostata su **{selected['name']}**", ephemeral=True)
 
     # Autocomplete
     @voice.autocomplete("voice")
     async def voice_autocomplete(self, interaction: discord.Interaction, current: str):
-        names = [v["name"] for v in self.voice_manager.voice_cache]
-        filtered = [n for n in names if current.lower() in n.lower()]
-        return [app_commands.Choice(name=n, value=n) for n in filtered[:25]]
+        names = self.voice_manager.catalog.search(current, limit=25)
+        return [app_commands.Choice(name=n, value=n) for n in names]
 
     # -------------------------------------------------------------------
     # SELECT MENU /tts myvoice
     # -------------------------------------------------------------------
     @tts.command(name="myvoice", description="Scegli la tua voce da una lista.")
     async def myvoice(self, interaction: discord.Interaction):
-        names = [v["name"] for v in self.voice_manager.voice_cache]
+        names = self.voice_manager.catalog.names()
         view = VoiceSelectView(names)
         await interaction.response.send_message("🎤 Scegli la tua voce:", view=view, ephemeral=True)
 
@@ -268,7 +596,7 @@ class TTSCog(commands.Cog):
     # -------------------------------------------------------------------
     @tts.command(name="list", description="Lista delle voci disponibili.")
     async def list(self, interaction: discord.Interaction):
-        names = [v["name"] for v in self.voice_manager.voice_cache]
+        names = self.voice_manager.catalog.names()
         text = "\n".join(f"• {n}" for n in names)
         await interaction.response.send_message(f"🎙️ **Voci disponibili:**\n{text}", ephemeral=True)
 
@@ -277,27 +605,35 @@ class TTSCog(commands.Cog):
     # -------------------------------------------------------------------
     @tts.command(name="resetvoice", description="Rimuove la tua voce personale.")
     async def resetvoice(self, interaction: discord.Interaction):
-        user = str(interaction.user.id)
-
-        if user not in self.tts_config["user_voices"]:
+        if not self.settings.clear_user(interaction.user.id, "voice"):
             await interaction.response.send_message("ℹ️ Non hai una voce personalizzata.", ephemeral=True)
             return
 
-        del self.tts_config["user_voices"][user]
-        self.save_config()
-
         await interaction.response.send_message("🔄 Voce personale rimossa.", ephemeral=True)
 
+    # -------------------------------------------------------------------
+    # /tts stats
+    # -------------------------------------------------------------------
+    @tts.command(name="stats", description="Contatori del TTS (ammissione, cache, code).")
+    @owner_or_has_permissions(administrator=True)
+    async def stats(self, interaction: discord.Interaction):
+        counters = self.admission.snapshot()
+        cache = self.voice_manager.cache.stats()
+        lines = [f"• {k}: {v}" for k, v in sorted(counters.items())]
+        lines.append(f"• cache hit/miss: {cache['hits']}/{cache['misses']} ({cache['disk_entries']} clip, {cache['disk_bytes'] // 1024} KB)")
+        session = self.sessions.get(interaction.guild.id)
+        if session is not None:
+            lines.append(f"• coda server: {len(session.queue)} clip, ~{int(session.queued_seconds)}s")
+        await interaction.response.send_message("📊 **Statistiche TTS:**\n" + "\n".join(lines), ephemeral=True)
+
     # -------------------------------------------------------------------
     # /tts stop
     # -------------------------------------------------------------------
     @tts.command(name="stop", description="Ferma il TTS.")
     async def stop(self, interaction: discord.Interaction):
-        vc = interaction.guild.voice_client
-        self.audio_queue.clear()
-
-        if vc and vc.is_playing():
-            vc.stop()
+        session = self.sessions.get(interaction.guild.id)
+        if session is not None:
+            session.stop()
 
         await interaction.response.send_message("⏹️ TTS fermato.", ephemeral=True)
 
@@ -0,0 +1,126 @@
+import time
+from collections import Counter
+from typing import Optional, Dict, Tuple
+
+from .tts_cache import normalize_text
+
+ADMIT = 'ok'
+REJECT_DUPLICATE = 'duplicate'
+REJECT_USER_RATE = 'user_rate'
+REJECT_GUILD_RATE = 'guild_rate'
+
+# Stima grossolana della durata parlata, usata per il limite di coda in secondi
+CHARS_PER_SECOND = 14.0
+
+
+def estimate_seconds(text: str) -> float:
+    return max(1.0, len(text) / CHARS_PER_SECOND)
+
+
+class TokenBucket:
+    """Token bucket classico: `capacity` token, ricaricati a `rate` token al secondo."""
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def can_take(self, cost: float) -> bool:
+        return self.tokens >= cost
+
+    def take(self, cost: float):
+        self.tokens -= cost
+
+    def retry_after(self, cost: float) -> float:
+        return max(0.0, (cost - self.tokens) / self.rate) if self.rate > 0 else float('inf')
+
+    def full(self) -> bool:
+        return self.tokens >= self.capacity
+
+
+class TTSAdmission:
+    """Ammissione delle richieste /tts say: doppio token bucket (utente e guild) e dedup.
+
+    Il costo di una richiesta e' il numero di pezzi in cui viene divisa, quindi
+    un testo lungo consuma piu' token di una frase breve. I token vengono
+    presi solo se entrambi i bucket possono pagare, cosi' un rifiuto della
+    guild non consuma il credito dell'utente. Una richiesta identica
+    (stesso testo normalizzato e stessa voce) all'ultima ammessa nella guild,
+    entro `dedup_window` secondi, viene scartata. `counters` raccoglie i
+    contatori per il monitoraggio.
+    """
+
+    def __init__(self, user_rate: float = 1 / 6, user_burst: float = 5,
+                 guild_rate: float = 1 / 2, guild_burst: float = 15, dedup_window: float = 10.0):
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.guild_rate = guild_rate
+        self.guild_burst = guild_burst
+        self.dedup_window = dedup_window
+        self.counters: Counter = Counter()
+        self._users: Dict[Tuple[int, int], TokenBucket] = {}
+        self._guilds: Dict[int, TokenBucket] = {}
+        self._last: Dict[int, Tuple[str, str, float]] = {}
+
+    def _bucket(self, table: dict, key, rate: float, capacity: float, now: float) -> TokenBucket:
+        bucket = table.get(key)
+        if bucket is None:
+            bucket = table[key] = TokenBucket(rate, capacity, now)
+        else:
+            bucket.refill(now)
+        return bucket
+
+    def check(self, guild_id: int, user_id: int, text: str, voice_id: str, cost: float = 1,
+              now: Optional[float] = None) -> Tuple[str, float]:
+        """Restituisce (esito, secondi di attesa suggeriti); l'esito e' ADMIT o un REJECT_*."""
+        now = time.monotonic() if now is None else now
+        self.counters['requests'] += 1
+        normalized = normalize_text(text)
+        last = self._last.get(guild_id)
+        if last and last[0] == normalized and last[1] == voice_id and now - last[2] < self.dedup_window:
+            self.counters['rejected_duplicate'] += 1
+            return REJECT_DUPLICATE, 0.0
+
+        user = self._bucket(self._users, (guild_id, user_id), self.user_rate, self.user_burst, now)
+        guild = self._bucket(self._guilds, guild_id, self.guild_rate, self.guild_burst, now)
+        # una richiesta piu' grande del burst non passerebbe mai: paga al massimo il bucket pieno
+        user_cost = min(cost, user.capacity)
+        guild_cost = min(cost, guild.capacity)
+        if not user.can_take(user_cost):
+            self.counters['rejected_user_rate'] += 1
+            return REJECT_USER_RATE, user.retry_after(user_cost)
+        if not guild.can_take(guild_cost):
+            self.counters['rejected_guild_rate'] += 1
+            return REJECT_GUILD_RATE, guild.retry_after(guild_cost)
+        user.take(user_cost)
+        guild.take(guild_cost)
+        self._last[guild_id] = (normalized, voice_id, now)
+        self.counters['admitted'] += 1
+        return ADMIT, 0.0
+
+    def count(self, name: str, amount: int = 1):
+        self.counters[name] += amount
+
+    def prune(self, now: Optional[float] = None):
+        """Elimina bucket tornati pieni e dedup scaduti (chiamata periodicamente)."""
+        now = time.monotonic() if now is None else now
+        for table in (self._users, self._guilds):
+            for key, bucket in list(table.items()):
+                bucket.refill(now)
+                if bucket.full():
+                    del table[key]
+        for guild_id, last in list(self._last.items()):
+            if now - last[2] >= self.dedup_window:
+                del self._last[guild_id]
+
+    def snapshot(self) -> Dict[str, int]:
+        data = dict(self.counters)
+        data['tracked_users'] = len(self._users)
+        data['tracked_guilds'] = len(self._guilds)
+        return data
@@ -0,0 +1,135 @@
+import asyncio
+import io
+import logging
+import threading
+from collections import deque
+from typing import Optional
+
+import discord
+from discord.oggparse import OggStream
+
+logger = logging.getLogger("tts")
+
+# Il flusso di ElevenLabs e' MP3: dichiararlo evita che FFmpeg attenda megabyte di dati per il probe
+FFMPEG_STREAM_BEFORE_OPTIONS = "-f mp3 -probesize 32 -analyzeduration 0"
+OPUS_BITRATE_KBPS = 64
+# Stessi parametri che discord.py usa per FFmpegOpusAudio: 48 kHz stereo, frame da 20 ms
+OPUS_ENCODE_ARGS = (
+    "-map_metadata", "-1", "-f", "opus", "-c:a", "libopus", "-ar", "48000", "-ac", "2",
+    "-b:a", f"{OPUS_BITRATE_KBPS}k", "-frame_duration", "20", "-application", "voip",
+)
+
+
+class AudioStream:
+    """Buffer audio riempito dal loop asyncio e letto dal thread di FFmpeg.
+
+    `feed` accoda i chunk appena arrivano dalla rete, `read` (chiamata dal
+    thread `_pipe_writer` di discord.py) si blocca finche' non ci sono dati o
+    lo stream e' terminato, cosi' la riproduzione parte col primo chunk.
+    """
+
+    def __init__(self):
+        self._chunks = deque()
+        self._cond = threading.Condition()
+        self._done = False
+        self._closed = False
+        self.error: Optional[BaseException] = None
+
+    def feed(self, chunk: bytes):
+        if not chunk:
+            return
+        with self._cond:
+            if self._closed:
+                return
+            self._chunks.append(chunk)
+            self._cond.notify_all()
+
+    def finish(self, error: Optional[BaseException] = None):
+        with self._cond:
+            self._done = True
+            self.error = error
+            self._cond.notify_all()
+
+    def close(self):
+        """Interrompe la lettura (es. /tts stop): `read` restituisce EOF."""
+        with self._cond:
+            self._closed = True
+            self._chunks.clear()
+            self._cond.notify_all()
+
+    @property
+    def complete(self) -> bool:
+        return self._done and self.error is None
+
+    def source(self) -> discord.AudioSource:
+        # FFmpeg codifica direttamente in Opus: discord.py non ricodifica ogni pacchetto PCM
+        return discord.FFmpegOpusAudio(self, pipe=True, bitrate=OPUS_BITRATE_KBPS, before_options=FFMPEG_STREAM_BEFORE_OPTIONS)
+
+    def read(self, size: int = -1) -> bytes:
+        with self._cond:
+            while not self._chunks and not self._done and not self._closed:
+                self._cond.wait()
+            if self._closed or not self._chunks:
+                return b""
+            if size < 0:
+                out = b"".join(self._chunks)
+                self._chunks.clear()
+                return out
+            out = bytearray()
+            while self._chunks and len(out) < size:
+                chunk = self._chunks.popleft()
+                take = size - len(out)
+                if len(chunk) > take:
+                    self._chunks.appendleft(chunk[take:])
+                    chunk = chunk[:take]
+                out += chunk
+            return bytes(out)
+
+
+class OpusPassthroughSource(discord.AudioSource):
+    """Riproduce un file Ogg Opus gia' codificato inviando i pacchetti cosi' come sono (nessun FFmpeg)."""
+
+    def __init__(self, data: bytes):
+        self._packets = OggStream(io.BytesIO(data)).iter_packets()
+
+    def read(self) -> bytes:
+        for packet in self._packets:
+            # OpusHead / OpusTags sono header del container, non audio
+            if packet[:8] in (b"OpusHead", b"OpusTags"):
+                continue
+            return packet
+        return b""
+
+    def is_opus(self) -> bool:
+        return True
+
+
+class CachedClip:
+    """Elemento di coda per un clip gia' in cache in formato Opus."""
+
+    def __init__(self, data: bytes):
+        self.data = data
+
+    def source(self) -> discord.AudioSource:
+        return OpusPassthroughSource(self.data)
+
+    def close(self):
+        pass
+
+
+async def encode_opus(mp3: bytes) -> Optional[bytes]:
+    """Converte una volta sola un clip MP3 in Ogg Opus (FFmpeg in un sottoprocesso)."""
+    try:
+        process = await asyncio.create_subprocess_exec(
+            "ffmpeg", "-hide_banner", "-loglevel", "error", "-f", "mp3", "-i", "pipe:0",
+            *OPUS_ENCODE_ARGS, "pipe:1",
+            stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+        )
+        out, err = await process.communicate(mp3)
+    except Exception as e:
+        logger.warning(f"Conversione Opus non disponibile: {e}")
+        return None
+    if process.returncode != 0 or not out:
+        logger.warning(f"Conversione Opus fallita: {err[:200]!r}")
+        return None
+    return out
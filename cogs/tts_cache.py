@@ -0,0 +1,165 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple
+
+# Formati in ordine di preferenza: Opus gia' pronto per Discord, poi l'MP3 originale
+CACHE_FORMATS = ("opus", "mp3")
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.split()).casefold()
+
+
+def cache_key(voice_id: str, model_id: str, voice_settings: Dict[str, Any], text: str) -> str:
+    raw = json.dumps([voice_id, model_id, voice_settings, normalize_text(text)], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class AudioCache:
+    """Cache LRU dell'audio sintetizzato: livello caldo in memoria + file su disco.
+
+    I file sono `<sha256>.<formato>` con la chiave calcolata da `cache_key`;
+    l'ordine LRU su disco e' l'mtime (aggiornato a ogni hit), quindi
+    sopravvive ai riavvii. `load` (scansione iniziale) e gli altri metodi
+    fanno I/O su disco e vanno chiamati con asyncio.to_thread.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 200 * 1024 * 1024, hot_bytes: int = 16 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hot_bytes = hot_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._disk: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_total = 0
+        self._hot: "OrderedDict[str, bytes]" = OrderedDict()
+        self._hot_total = 0
+
+    def load(self):
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            self._disk.clear()
+            self._disk_total = 0
+            self._scan()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _scan(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if os.path.splitext(name)[1].lstrip(".") not in CACHE_FORMATS:
+                continue
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, name, st.st_size))
+        for _, name, size in sorted(entries):
+            self._disk[name] = size
+            self._disk_total += size
+
+    # ------------------------------
+    # Livello in memoria
+    # ------------------------------
+    def _hot_put(self, key: str, data: bytes):
+        if len(data) > self.hot_bytes:
+            return
+        old = self._hot.pop(key, None)
+        if old is not None:
+            self._hot_total -= len(old)
+        self._hot[key] = data
+        self._hot_total += len(data)
+        while self._hot_total > self.hot_bytes:
+            _, evicted = self._hot.popitem(last=False)
+            self._hot_total -= len(evicted)
+
+    # ------------------------------
+    # API
+    # ------------------------------
+    def get(self, key: str) -> Optional[Tuple[bytes, str]]:
+        """Restituisce (dati, formato) nel formato migliore disponibile, o None."""
+        with self._lock:
+            for fmt in CACHE_FORMATS:
+                name = f"{key}.{fmt}"
+                data = self._hot.get(name)
+                if data is not None:
+                    self._hot.move_to_end(name)
+                    if name in self._disk:
+                        self._disk.move_to_end(name)
+                    self.hits += 1
+                    return data, fmt
+            name = next((f"{key}.{fmt}" for fmt in CACHE_FORMATS if f"{key}.{fmt}" in self._disk), None)
+            if name is None:
+                self.misses += 1
+                return None
+        fmt = name.rsplit(".", 1)[1]
+        try:
+            with open(self._path(name), "rb") as f:
+                data = f.read()
+            os.utime(self._path(name))
+        except OSError:
+            with self._lock:
+                size = self._disk.pop(name, None)
+                if size is not None:
+                    self._disk_total -= size
+                self.misses += 1
+            return None
+        with self._lock:
+            if name in self._disk:
+                self._disk.move_to_end(name)
+            self._hot_put(name, data)
+            self.hits += 1
+        return data, fmt
+
+    def put(self, key: str, data: bytes, fmt: str = "mp3"):
+        """Salva il clip; un formato preferito sostituisce quelli meno adatti gia' presenti."""
+        if not data:
+            return
+        name = f"{key}.{fmt}"
+        path = self._path(name)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        evicted = []
+        with self._lock:
+            superseded = [f"{key}.{other}" for other in CACHE_FORMATS[CACHE_FORMATS.index(fmt) + 1:]] if fmt in CACHE_FORMATS else []
+            for old_name in [name] + superseded:
+                if self._drop_locked(old_name) and old_name != name:
+                    evicted.append(old_name)
+            self._disk[name] = len(data)
+            self._disk_total += len(data)
+            self._hot_put(name, data)
+            while self._disk_total > self.max_bytes and len(self._disk) > 1:
+                old_name = next(iter(self._disk))
+                self._drop_locked(old_name)
+                evicted.append(old_name)
+        for old_name in evicted:
+            try:
+                os.remove(self._path(old_name))
+            except OSError:
+                pass
+
+    def _drop_locked(self, name: str) -> bool:
+        size = self._disk.pop(name, None)
+        if size is not None:
+            self._disk_total -= size
+        hot = self._hot.pop(name, None)
+        if hot is not None:
+            self._hot_total -= len(hot)
+        return size is not None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_total,
+                "hot_bytes": self._hot_total,
+            }
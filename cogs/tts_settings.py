@@ -0,0 +1,202 @@
+import asyncio
+import copy
+import json
+import logging
+import os
+from typing import Optional, Dict, Any, List
+
+logger = logging.getLogger("tts")
+
+
+class TTSSettings:
+    """Impostazioni TTS in memoria con salvataggi differiti fuori dal loop.
+
+    - `config`: impostazioni globali (preset, profili...) salvate in `path`
+      con una riscrittura atomica
+    - impostazioni per utente in `users_path` + journal: ogni modifica e' una
+      riga `put`/`del`, come in TicketStore, quindi cambiare voce non riscrive
+      il file di tutti gli utenti; superate `compact_every` righe il journal
+      viene compattato in un nuovo snapshot
+
+    Le modifiche aggiornano subito la memoria e pianificano un `flush` dopo
+    `delay` secondi: piu' modifiche ravvicinate finiscono in una sola
+    scrittura, eseguita con asyncio.to_thread. `load` fa I/O bloccante e va
+    chiamata anch'essa in un thread.
+    """
+
+    def __init__(self, path: str, users_path: str, defaults: Dict[str, Any],
+                 journal_path: Optional[str] = None, delay: float = 2.0, compact_every: int = 500):
+        self.path = path
+        self.users_path = users_path
+        self.journal_path = journal_path or os.path.splitext(users_path)[0] + '.journal'
+        self.defaults = defaults
+        self.delay = delay
+        self.compact_every = compact_every
+        self.config: Dict[str, Any] = copy.deepcopy(defaults)
+        self._users: Dict[str, Dict[str, Any]] = {}
+        self._pending: List[Dict[str, Any]] = []
+        self._config_dirty = False
+        self._journal_lines = 0
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._flush_lock = asyncio.Lock()
+
+    # ------------------------------
+    # Caricamento
+    # ------------------------------
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            data = None
+        except Exception as e:
+            logger.error(f"Impossibile leggere {self.path}: {e}")
+            data = None
+        if isinstance(data, dict):
+            self.config = data
+        else:
+            self.config = copy.deepcopy(self.defaults)
+            self._config_dirty = True
+        for key, value in self.defaults.items():
+            self.config.setdefault(key, copy.deepcopy(value))
+
+        try:
+            with open(self.users_path, 'r', encoding='utf-8') as f:
+                users = json.load(f)
+        except Exception:
+            users = {}
+        self._users = {str(k): v for k, v in users.items() if isinstance(v, dict)} if isinstance(users, dict) else {}
+        replayed = 0
+        try:
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # ultima riga troncata da un crash: ignorata
+                        continue
+                    if entry.get('op') == 'put':
+                        self._users[str(entry['id'])] = entry['data']
+                    elif entry.get('op') == 'del':
+                        self._users.pop(str(entry['id']), None)
+                    replayed += 1
+        except FileNotFoundError:
+            pass
+        self._journal_lines = replayed
+
+        # vecchio formato: le voci personali stavano dentro tts.json
+        legacy = self.config.pop('user_voices', None)
+        if isinstance(legacy, dict) and legacy:
+            for uid, voice in legacy.items():
+                self._users.setdefault(str(uid), {})['voice'] = voice
+            self._config_dirty = True
+            self._write(self._config_snapshot(), [], self._users_snapshot())
+            self._config_dirty = False
+        elif replayed:
+            self._write(None, [], self._users_snapshot())
+
+    # ------------------------------
+    # API
+    # ------------------------------
+    def get(self, key: str, default=None):
+        return self.config.get(key, default)
+
+    def set(self, key: str, value):
+        self.config[key] = value
+        self._config_dirty = True
+        self._schedule()
+
+    def user_voice(self, user_id) -> Optional[str]:
+        return self._users.get(str(user_id), {}).get('voice')
+
+    def set_user(self, user_id, **fields):
+        uid = str(user_id)
+        record = dict(self._users.get(uid, {}))
+        record.update(fields)
+        self._users[uid] = record
+        self._pending.append({'op': 'put', 'id': uid, 'data': record})
+        self._schedule()
+
+    def clear_user(self, user_id, field: str) -> bool:
+        uid = str(user_id)
+        record = self._users.get(uid)
+        if not record or field not in record:
+            return False
+        record = {k: v for k, v in record.items() if k != field}
+        if record:
+            self._users[uid] = record
+            self._pending.append({'op': 'put', 'id': uid, 'data': record})
+        else:
+            del self._users[uid]
+            self._pending.append({'op': 'del', 'id': uid})
+        self._schedule()
+        return True
+
+    # ------------------------------
+    # Salvataggio differito
+    # ------------------------------
+    def _schedule(self):
+        if self._handle is not None:
+            return
+        loop = asyncio.get_running_loop()
+        self._handle = loop.call_later(self.delay, lambda: asyncio.create_task(self.flush()))
+
+    def _config_snapshot(self) -> Dict[str, Any]:
+        return copy.deepcopy(self.config)
+
+    def _users_snapshot(self) -> Dict[str, Dict[str, Any]]:
+        return {uid: dict(record) for uid, record in self._users.items()}
+
+    async def flush(self):
+        """Scrive le modifiche accumulate; le copie vengono fatte sul loop, l'I/O in un thread."""
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        async with self._flush_lock:
+            config = self._config_snapshot() if self._config_dirty else None
+            entries, self._pending = self._pending, []
+            self._config_dirty = False
+            users = None
+            if entries and self._journal_lines + len(entries) >= self.compact_every:
+                users = self._users_snapshot()
+            if config is None and not entries:
+                return
+            try:
+                await asyncio.to_thread(self._write, config, entries, users)
+            except Exception as e:
+                logger.error(f"Salvataggio impostazioni TTS fallito: {e}")
+                # si riprova al prossimo flush
+                self._pending = entries + self._pending
+                self._config_dirty = self._config_dirty or config is not None
+                self._schedule()
+
+    def _write(self, config: Optional[Dict[str, Any]], entries: List[Dict[str, Any]], users: Optional[Dict[str, Any]]):
+        if config is not None:
+            _atomic_dump(self.path, config, indent=2)
+        if users is not None:
+            # lo snapshot contiene gia' le ultime modifiche: il journal si azzera
+            _atomic_dump(self.users_path, users)
+            try:
+                os.remove(self.journal_path)
+            except FileNotFoundError:
+                pass
+            self._journal_lines = 0
+        elif entries:
+            with open(self.journal_path, 'a', encoding='utf-8') as f:
+                for entry in entries:
+                    f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self._journal_lines += len(entries)
+
+    async def close(self):
+        await self.flush()
+
+
+def _atomic_dump(path: str, data, indent: Optional[int] = None):
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=indent, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
@@ -0,0 +1,138 @@
+import bisect
+import json
+import os
+import time
+from typing import Optional, Dict, Any, List, Tuple
+
+# Campi utili delle voci: il resto della risposta (sample, impostazioni...) non viene tenuto
+VOICE_FIELDS = ("voice_id", "name", "category", "labels")
+
+
+class VoiceCatalog:
+    """Catalogo delle voci ElevenLabs con indici e copia su disco.
+
+    - `get(name)`: lookup per nome (case-insensitive) in O(1)
+    - `search(text)`: prima i nomi che iniziano con il testo (bisect sulla
+      lista ordinata), poi quelli che lo contengono, senza ricalcolare
+      `.lower()` a ogni tasto premuto
+    Il catalogo viene salvato in `path` per avere le voci subito all'avvio;
+    `needs_refresh` dice se conviene riscaricarlo (scaduto o segnato come
+    vecchio, e non in attesa del backoff dopo un errore).
+
+    Un nome sconosciuto segna il catalogo come vecchio una volta sola: se
+    manca anche dopo il nuovo download resta in `_missing` e non provoca
+    altri aggiornamenti fino alla scadenza del TTL. Gli aggiornamenti
+    chiesti da `mark_stale` sono comunque distanti almeno `stale_interval`
+    secondi dall'ultimo download.
+    """
+
+    def __init__(self, path: str, ttl: float = 6 * 3600, min_backoff: float = 60, max_backoff: float = 3600,
+                 stale_interval: float = 15 * 60):
+        self.path = path
+        self.ttl = ttl
+        self.stale_interval = stale_interval
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.voices: List[Dict[str, Any]] = []
+        self.etag: Optional[str] = None
+        self.fetched_at = 0.0
+        self._stale = False
+        self._failures = 0
+        self._retry_at = 0.0
+        # nomi cercati e non trovati: in attesa di verifica / gia' verificati dopo un download
+        self._wanted = set()
+        self._missing = set()
+        self._by_name: Dict[str, Dict[str, Any]] = {}
+        self._sorted: List[Tuple[str, str]] = []
+
+    # ------------------------------
+    # Indici
+    # ------------------------------
+    def _index(self):
+        self._by_name = {}
+        for voice in self.voices:
+            name = voice.get("name")
+            if name:
+                self._by_name.setdefault(name.casefold(), voice)
+        self._sorted = sorted((key, voice["name"]) for key, voice in self._by_name.items())
+
+    def get(self, name: str) -> Optional[Dict[str, Any]]:
+        return self._by_name.get(name.casefold())
+
+    def names(self) -> List[str]:
+        return [name for _, name in self._sorted]
+
+    def search(self, text: str, limit: int = 25) -> List[str]:
+        query = text.casefold()
+        if not query:
+            return self.names()[:limit]
+        out = []
+        i = bisect.bisect_left(self._sorted, (query,))
+        while i < len(self._sorted) and self._sorted[i][0].startswith(query) and len(out) < limit:
+            out.append(self._sorted[i][1])
+            i += 1
+        if len(out) < limit:
+            for key, name in self._sorted:
+                if query in key and not key.startswith(query):
+                    out.append(name)
+                    if len(out) >= limit:
+                        break
+        return out
+
+    # ------------------------------
+    # Aggiornamento
+    # ------------------------------
+    def mark_stale(self, name: Optional[str] = None):
+        if name is not None:
+            key = name.casefold()
+            if key in self._missing:
+                return
+            self._wanted.add(key)
+        self._stale = True
+
+    def needs_refresh(self, now: Optional[float] = None) -> bool:
+        now = time.time() if now is None else now
+        if now < self._retry_at:
+            return False
+        if not self.voices or now - self.fetched_at >= self.ttl:
+            return True
+        return self._stale and now - self.fetched_at >= self.stale_interval
+
+    def update(self, voices: Optional[List[Dict[str, Any]]], etag: Optional[str] = None):
+        """Applica una risposta riuscita; `voices=None` significa non modificato (304)."""
+        if voices is not None:
+            self.voices = [{k: v.get(k) for k in VOICE_FIELDS} for v in voices if v.get("voice_id")]
+            self._index()
+        self._missing = {key for key in self._missing | self._wanted if key not in self._by_name}
+        self._wanted = set()
+        if etag:
+            self.etag = etag
+        self.fetched_at = time.time()
+        self._stale = False
+        self._failures = 0
+        self._retry_at = 0.0
+
+    def failed(self):
+        self._failures += 1
+        delay = min(self.max_backoff, self.min_backoff * (2 ** (self._failures - 1)))
+        self._retry_at = time.time() + delay
+
+    # ------------------------------
+    # Persistenza
+    # ------------------------------
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception:
+            return
+        self.voices = data.get("voices", [])
+        self.etag = data.get("etag")
+        self.fetched_at = float(data.get("fetched_at", 0))
+        self._index()
+
+    def save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"fetched_at": self.fetched_at, "etag": self.etag, "voices": self.voices}, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
@@ -0,0 +1,66 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cogs.tickets import Tickets
+
+
+class FakeChannel:
+    def __init__(self, channel_id):
+        self.id = channel_id
+
+
+def make_cog():
+    cog = Tickets.__new__(Tickets)
+    cog._transcript_locks = {}
+    return cog
+
+
+def test_concurrent_transcripts_of_same_ticket_are_serialized():
+    cog = make_cog()
+    events = []
+
+    async def fake_write(channel, requested_by, invoked_by):
+        events.append(('start', invoked_by))
+        await asyncio.sleep(0.01)
+        events.append(('end', invoked_by))
+        return [invoked_by]
+
+    cog._write_transcript = fake_write
+
+    async def run():
+        channel = FakeChannel(1)
+        return await asyncio.gather(
+            cog.create_transcript(channel, None, 'button'),
+            cog.create_transcript(channel, None, 'delete'),
+        )
+
+    results = asyncio.run(run())
+    assert results == [['button'], ['delete']]
+    assert events == [('start', 'button'), ('end', 'button'), ('start', 'delete'), ('end', 'delete')]
+
+
+def test_transcripts_of_different_tickets_run_in_parallel():
+    cog = make_cog()
+    running = []
+    overlap = []
+
+    async def fake_write(channel, requested_by, invoked_by):
+        running.append(channel.id)
+        await asyncio.sleep(0.01)
+        overlap.append(len(running))
+        running.remove(channel.id)
+        return []
+
+    cog._write_transcript = fake_write
+
+    async def run():
+        await asyncio.gather(
+            cog.create_transcript(FakeChannel(1), None, 'button'),
+            cog.create_transcript(FakeChannel(2), None, 'button'),
+        )
+
+    asyncio.run(run())
+    assert max(overlap) == 2